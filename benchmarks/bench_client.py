@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark TimblClient latency and throughput
+
+Classifies instances one at a time and pipelined with classify_many, for
+combinations of receive buffer size and reply size. Reply size is varied
+through the number of neighbours (-k with +vn). By default a fake Timbl
+server is started in a separate process, so Timbl need not be installed;
+use --port to benchmark against a running (real) server instead. Besides
+wall-clock time, the CPU time of the client process is reported, which is
+not affected by the server competing for the same CPUs.
+
+Example:
+  $ python bench_client.py -n 2000 -b 256 2048 65536 -k 0 10 100
+"""
+
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+from tt.argparse import ArgumentParser, RawDescriptionHelpFormatter
+from tt.client import TimblClient
+
+from benchutil import print_header, print_result
+from fake_server import start_server_process
+
+
+INSTANCE = "=,=,=,=,+,k,e,=,-,r,@,l,T"
+
+
+def reply_size(port, k):
+    # size in bytes of a classify reply with k neighbours
+    sock = socket.create_connection(("localhost", port))
+    f = sock.makefile()
+    f.readline()
+    f.write("set {0}\n".format(k and "+vn -k{0}".format(k) or "-vn"))
+    f.write("classify " + INSTANCE + "\n")
+    f.flush()
+    f.readline()
+    reply = f.readline()
+
+    while k and not reply.endswith("ENDNEIGHBORS\n"):
+        reply += f.readline()
+
+    f.write("exit\n")
+    f.close()
+    sock.close()
+    return len(reply)
+
+
+def bench_classify(port, bufsize, k, n):
+    client = TimblClient(port, bufsize=bufsize)
+    client.connect()
+    client.set(k and "+vn -k{0}".format(k) or "-vn")
+    latencies = []
+    start = time.time()
+    cpu_start = time.clock()
+
+    for i in xrange(n):
+        t = time.time()
+        client.classify(INSTANCE)
+        latencies.append(time.time() - t)
+
+    seconds = time.time() - start
+    cpu_seconds = time.clock() - cpu_start
+    client.disconnect()
+    latencies.sort()
+    median = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    return seconds, cpu_seconds, median, p99
+
+
+def bench_classify_many(port, bufsize, k, n, window):
+    client = TimblClient(port, bufsize=bufsize)
+    client.connect()
+    client.set(k and "+vn -k{0}".format(k) or "-vn")
+    start = time.time()
+    cpu_start = time.clock()
+
+    for inst, result in client.classify_many([INSTANCE] * n, window=window):
+        pass
+
+    seconds = time.time() - start
+    cpu_seconds = time.clock() - cpu_start
+    client.disconnect()
+    return seconds, cpu_seconds
+
+
+def print_cpu(cpu_seconds, n):
+    sys.stdout.write("{0:<44} {1:10.1f} us\n".format(
+        "  client CPU time per instance", cpu_seconds / n * 1e6))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("-n", "--instances",
+                        type=int,
+                        default=5000,
+                        help="number of instances classified per run")
+
+    parser.add_argument("-b", "--bufsizes",
+                        type=int,
+                        nargs="+",
+                        default=[256, 2048, 8192, 65536],
+                        help="receive buffer sizes of client")
+
+    parser.add_argument("-k", "--neighbours",
+                        type=int,
+                        nargs="+",
+                        default=[0, 10, 100],
+                        help="numbers of neighbours in reply, "
+                        "where 0 means no +vn")
+
+    parser.add_argument("-w", "--window",
+                        type=int,
+                        default=100,
+                        help="window of pipelined classification")
+
+    parser.add_argument("-p", "--port",
+                        type=int,
+                        help="port of running Timbl server, which is "
+                        "otherwise started as a fake server")
+
+    args = parser.parse_args()
+
+    if args.port:
+        proc, port = None, args.port
+    else:
+        proc, port = start_server_process()
+
+    try:
+        for k in args.neighbours:
+            print_header("k={0}, reply size={1} bytes".format(
+                k, reply_size(port, k)))
+
+            for bufsize in args.bufsizes:
+                seconds, cpu_seconds, median, p99 = bench_classify(
+                    port, bufsize, k, args.instances)
+                print_result("classify bufsize={0}".format(bufsize),
+                             seconds, args.instances)
+                print_cpu(cpu_seconds, args.instances)
+                sys.stdout.write(
+                    "{0:<44} {1:10.1f} us {2:10.1f} us\n".format(
+                        "  latency median, 99th percentile",
+                        median * 1e6, p99 * 1e6))
+                seconds, cpu_seconds = bench_classify_many(
+                    port, bufsize, k, args.instances, args.window)
+                print_result("classify_many bufsize={0}".format(bufsize),
+                             seconds, args.instances)
+                print_cpu(cpu_seconds, args.instances)
+    finally:
+        if proc:
+            proc.kill()
+            proc.wait()
+
+
+
+if __name__ == "__main__":
+    main()
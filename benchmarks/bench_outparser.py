@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark parsing of Timbl output
+
+Generates Timbl output files with and without nearest neighbours, and times
+the lazy parsers (parse_timbl_output, parse_inst and the neighbour parsers)
+against the bulk alternatives (parse_output_columns, the batch neighbour
+parsers and evaluate_output).
+
+Example:
+  $ python bench_outparser.py -n 100000 -k 10
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+from tt.argparse import ArgumentParser, RawDescriptionHelpFormatter
+from tt.outparser import *
+from tt.evaluate import evaluate_output
+
+from benchutil import best_time, make_output, print_header, print_result
+
+
+def parse_lazy(out_fn):
+    for inst_str, k_nn_list in parse_timbl_output(open(out_fn)):
+        parse_inst(inst_str, feat_sep=",", with_distrib=True,
+                   with_distance=True)
+
+
+def parse_neighbours(out_fn):
+    # same results as parse_neighbours_batch, but parsed line by line
+    class_ids = {}
+
+    for inst_str, k_nn_list in parse_timbl_output(open(out_fn)):
+        distances = array("d")
+        feats = []
+        ids = array("I")
+
+        for nn_str in k_nn_list:
+            if nn_str.startswith("# k="):
+                distances.append(parse_distance_vn_vdb(nn_str))
+            else:
+                feats_str, class_ = parse_neighbour_vn_vdb(nn_str)
+                feats.append(feats_str)
+                ids.append(class_ids.setdefault(class_, len(class_ids)))
+
+
+def parse_neighbours_batch(out_fn):
+    class_ids = {}
+
+    for inst_str, k_nn_list in parse_timbl_output(open(out_fn)):
+        parse_distance_vn_vdb_batch(k_nn_list)
+        parse_neighbour_vn_vdb_batch(k_nn_list, class_ids)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("-n", "--instances",
+                        type=int,
+                        default=100000,
+                        help="number of instances in output")
+
+    parser.add_argument("-k", "--neighbours",
+                        type=int,
+                        default=10,
+                        help="number of neighbours per instance in output "
+                        "with +vn")
+
+    parser.add_argument("-r", "--repeat",
+                        type=int,
+                        default=3,
+                        help="number of runs, of which the best is reported")
+
+    args = parser.parse_args()
+    n = args.instances
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        out_fn = os.path.join(tmp_dir, "plain.out")
+        make_output(out_fn, n)
+        vn_out_fn = os.path.join(tmp_dir, "vn.out")
+        make_output(vn_out_fn, n, k=args.neighbours)
+
+        print_header("output without neighbours ({0} bytes)".format(
+            os.path.getsize(out_fn)))
+        print_result("parse_timbl_output + parse_inst",
+                     best_time(lambda: parse_lazy(out_fn), args.repeat), n)
+        print_result("parse_output_columns",
+                     best_time(lambda: parse_output_columns(
+                         out_fn, feat_sep=",", with_distrib=True,
+                         with_distance=True), args.repeat), n)
+        print_result("evaluate_output",
+                     best_time(lambda: evaluate_output(
+                         out_fn, feat_sep=",", with_distrib=True,
+                         with_distance=True), args.repeat), n)
+        print_result("evaluate_output processes=4",
+                     best_time(lambda: evaluate_output(
+                         out_fn, feat_sep=",", with_distrib=True,
+                         with_distance=True, processes=4), args.repeat), n)
+
+        print_header("output with k={0} neighbours ({1} bytes)".format(
+            args.neighbours, os.path.getsize(vn_out_fn)))
+        print_result("parse_timbl_output + parse_inst",
+                     best_time(lambda: parse_lazy(vn_out_fn), args.repeat), n)
+        print_result("neighbour parsers",
+                     best_time(lambda: parse_neighbours(vn_out_fn),
+                               args.repeat), n)
+        print_result("batch neighbour parsers",
+                     best_time(lambda: parse_neighbours_batch(vn_out_fn),
+                               args.repeat), n)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark class counting and down-sampling of instances
+
+Generates an instance file and times get_class_counts (sequential and
+parallel), sample_down, sample_down_exact and sample_down_multi.
+
+Example:
+  $ python bench_sample.py -n 1000000
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+from tt.argparse import ArgumentParser, RawDescriptionHelpFormatter
+from tt.sample import *
+
+from benchutil import best_time, make_instances, print_header, print_result
+
+
+def main():
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("-n", "--instances",
+                        type=int,
+                        default=500000,
+                        help="number of instances")
+
+    parser.add_argument("-p", "--processes",
+                        type=int,
+                        default=4,
+                        help="number of processes for parallel counting")
+
+    parser.add_argument("-r", "--repeat",
+                        type=int,
+                        default=3,
+                        help="number of runs, of which the best is reported")
+
+    args = parser.parse_args()
+    n = args.instances
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        inst_fn = os.path.join(tmp_dir, "sample.inst")
+        make_instances(inst_fn, n)
+        sample_fn = os.path.join(tmp_dir, "sample.out")
+        class_fracts = {"C0": 0.1, "C1": 0.5}
+        sizes = dict( (class_, int(count * class_fracts.get(class_, 1.0)))
+                      for class_, count in
+                      get_class_counts(inst_fn, sep=",").items() )
+
+        print_header("{0} instances ({1} bytes)".format(
+            n, os.path.getsize(inst_fn)))
+        print_result("get_class_counts",
+                     best_time(lambda: get_class_counts(inst_fn, sep=","),
+                               args.repeat), n)
+        print_result("get_class_counts processes={0}".format(args.processes),
+                     best_time(lambda: get_class_counts(
+                         inst_fn, sep=",", processes=args.processes),
+                         args.repeat), n)
+        print_result("sample_down",
+                     best_time(lambda: sample_down(
+                         inst_fn, class_fracts, sep=",", outf=sample_fn),
+                         args.repeat), n)
+        print_result("sample_down_exact fractions",
+                     best_time(lambda: sample_down_exact(
+                         inst_fn, class_fracts=class_fracts, sep=",",
+                         outf=sample_fn), args.repeat), n)
+        print_result("sample_down_exact sizes",
+                     best_time(lambda: sample_down_exact(
+                         inst_fn, class_sizes=sizes, sep=",",
+                         outf=sample_fn), args.repeat), n)
+        profiles = [ (os.path.join(tmp_dir, "sample{0}.out".format(i)),
+                      {"C0": i / 10.0})
+                     for i in range(1, 11) ]
+        print_result("sample_down_multi 10 profiles",
+                     best_time(lambda: sample_down_multi(
+                         inst_fn, profiles, sep=","), args.repeat), n)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+
+if __name__ == "__main__":
+    main()
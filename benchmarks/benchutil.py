@@ -0,0 +1,78 @@
+"""
+Support for benchmarks: timing, reporting and generating test data
+"""
+
+import random
+import sys
+import time
+
+
+def best_time(func, repeat=3):
+    """
+    Return the best wall clock time in seconds of repeated calls to func
+    """
+    times = []
+
+    for i in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+
+    return min(times)
+
+
+def print_header(title, out=sys.stdout):
+    line = 78 * "-" + "\n"
+    out.write(line)
+    out.write(title + "\n")
+    out.write(line)
+
+
+def print_result(name, seconds, n, unit="instances", out=sys.stdout):
+    """
+    Print time and throughput of a benchmark
+    """
+    out.write("{0:<44} {1:10.4f} s {2:14.0f} {3}/s\n".format(
+        name, seconds, n / (seconds or 1e-9), unit))
+
+
+def make_instances(fn, n, n_feats=12, n_values=20, n_classes=5, sep=",",
+                   seed=1):
+    """
+    Write n random instances to file, with skewed class distribution
+    """
+    rng = random.Random(seed)
+    values = [ "v{0}".format(i) for i in range(n_values) ]
+    # class i is about twice as frequent as class i+1
+    classes = [ "C{0}".format(i) for i in range(n_classes)
+                for j in range(2 ** (n_classes - i - 1)) ]
+
+    with open(fn, "w") as f:
+        for i in xrange(n):
+            f.write(sep.join([ rng.choice(values) for j in range(n_feats) ] +
+                             [ rng.choice(classes) ]) + "\n")
+
+
+def make_output(fn, n, k=0, n_feats=12, n_values=20, n_classes=5, sep=",",
+                seed=1):
+    """
+    Write Timbl output for n random instances to file, as produced with
+    +vdb +vdi, and with +vn if k > 0
+    """
+    rng = random.Random(seed)
+    values = [ "v{0}".format(i) for i in range(n_values) ]
+    classes = [ "C{0}".format(i) for i in range(n_classes) ]
+
+    with open(fn, "w") as f:
+        for i in xrange(n):
+            feats = sep.join(rng.choice(values) for j in range(n_feats))
+            true_class = rng.choice(classes)
+            pred_class = rng.choice([true_class, rng.choice(classes)])
+            f.write("{0}{1}{2}{1}{3} {{ {3} 2.00000, {2} 1.00000 }}"
+                    "        {4:.13f}\n".format(feats, sep, true_class,
+                                                 pred_class, rng.random()))
+
+            for j in range(1, k + 1):
+                f.write("# k={0}, 1 Neighbor(s) at distance: \t{1:.13f}\n"
+                        "#\t{2}{3}{{ {4} 1.00000 }}\n".format(
+                            j, j * 0.01, feats, sep, rng.choice(classes)))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fake Timbl server for benchmarking
+
+A lightweight stand-in for a Timbl server, speaking the same protocol: a
+welcome message on connecting, and the classify, query, set and exit
+commands. Classification simply predicts the last field of an instance, and
+with +vn the reply lists k neighbours, so reply sizes can be varied with the
+-k option. This allows benchmarking clients without Timbl being installed.
+
+Example:
+  $ fake_server.py 7000 &
+  $ python bench_client.py --port 7000
+"""
+
+import re
+import socket
+import SocketServer
+import subprocess
+import sys
+import threading
+import time
+
+__author__ = 'Erwin Marsi <e.marsi@gmail.com>'
+__version__ = "0.5"
+
+
+class TimblRequestHandler(SocketServer.StreamRequestHandler):
+    """
+    Handles the commands of a single client connection
+    """
+
+    # replies over 8KB are written in more than one send, and with Nagle's
+    # algorithm the last one waits for a delayed ACK from the client
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        opts = { "vn": False, "vdb": False, "vdi": False, "k": "1",
+                 "d": "Z" }
+        self.wfile.write("Welcome to the Timbl server.\n")
+
+        for line in self.rfile:
+            line = line.strip()
+
+            if line.startswith("classify"):
+                self.wfile.write(self.classify(line[9:], opts))
+            elif line == "query":
+                self.wfile.write("STATUS\nNEIGHBORS : {0[k]}\n"
+                                 "DECAY : {0[d]}\nENDSTATUS\n".format(opts))
+            elif line.startswith("set"):
+                self.wfile.write(self.set(line[4:], opts))
+            elif line == "exit":
+                break
+            else:
+                self.wfile.write("ERROR { Unknown command }\n")
+
+    def classify(self, inst, opts):
+        fields = inst.replace(",", " ").split()
+
+        if len(fields) < 2:
+            return "ERROR { Couldn't convert to Instance }\n"
+
+        class_ = fields[-1]
+        feats = inst[:inst.rfind(class_)]
+        reply = "CATEGORY {" + class_ + "}"
+
+        if opts["vdb"]:
+            reply += " DISTRIBUTION { " + class_ + " 1.00000 }"
+
+        if opts["vdi"]:
+            reply += " DISTANCE {0.0000000000000}"
+
+        if not opts["vn"]:
+            return reply + "\n"
+
+        reply += " NEIGHBORS\n"
+
+        for k in range(1, int(opts["k"]) + 1):
+            reply += ( "# k={0}, 1 Neighbor(s) at distance: \t0.0{0}\n"
+                       "#\t{1}{{ {2} 1.00000 }}\n".format(k, feats, class_) )
+
+        return reply + "ENDNEIGHBORS\n"
+
+    def set(self, options, opts):
+        tokens = options.split()
+        i = 0
+
+        while i < len(tokens):
+            token = tokens[i]
+            match = re.match(r"([+-])v(db|di|n)$", token)
+
+            if match:
+                opts["v" + match.group(2)] = match.group(1) == "+"
+            elif token[:2] in ("-k", "-d"):
+                value = token[2:]
+
+                if not value:
+                    i += 1
+
+                    if i == len(tokens):
+                        # like Timbl, send no reply at all
+                        return ""
+
+                    value = tokens[i]
+
+                opts[token[1]] = value
+            else:
+                return "ERROR { set options failed }\n"
+
+            i += 1
+
+        return "OK\n"
+
+
+
+class FakeTimblServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """
+    Fake Timbl server handling every connection in its own thread
+
+    Use port 0 to let the system pick a free port, which is then available
+    as the port attribute.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port=0, host="localhost"):
+        SocketServer.TCPServer.__init__(self, (host, port),
+                                        TimblRequestHandler)
+        self.port = self.server_address[1]
+
+    def start(self):
+        """
+        Serve in a background thread
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+
+def start_server_process(port=0):
+    """
+    Start fake server in a separate process, so it does not compete with the
+    benchmarked client for the interpreter lock
+
+    @return: tuple of process and port
+    """
+    if not port:
+        sock = socket.socket()
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+    proc = subprocess.Popen([sys.executable, __file__, str(port)])
+
+    # wait until server accepts connections
+    for i in range(100):
+        try:
+            socket.create_connection(("localhost", port)).close()
+            return proc, port
+        except socket.error:
+            time.sleep(0.05)
+
+    proc.kill()
+    raise RuntimeError("fake server did not start on port {0}".format(port))
+
+
+
+if __name__ == "__main__":
+    FakeTimblServer(int(sys.argv[1])).serve_forever()
@@ -4,11 +4,13 @@
 """
 Show class distribution of Timbl instances
 
-Reads Timbl instances from standard input and writes a class distribution in
-the form of an ascii table to standard output.
+Reads Timbl instances from a file or standard input and writes a class
+distribution in the form of an ascii table to standard output. Instances in
+an uncompressed file are counted by several processes in parallel.
 
-Example:
+Examples:
   $ tt-class-dist.py -d, < ../data/dimin.train 
+  $ tt-class-dist.py -d, -p 4 ../data/dimin.train 
 """
 
 import sys
@@ -30,7 +32,26 @@ parser.add_argument("-d", "--delimiter",
                     help="field delimiter in instances "
                     "(default is whitespace)")
 
+parser.add_argument("-p", "--processes",
+                    type=int,
+                    default=None,
+                    metavar="N",
+                    help="number of processes counting a file in parallel "
+                    "(default is number of cpus)")
+
+parser.add_argument("-c", "--cache",
+                    action="store_true",
+                    help="save counts of file in a sidecar file, and reuse "
+                    "them as long as the file is unchanged")
+
+parser.add_argument("file",
+                    nargs="?",
+                    help="file with instances, which may be compressed "
+                    "(default is standard input)")
+
 args = parser.parse_args()
 
-class_counts = get_class_counts(sys.stdin, sep=args.delimiter)
+class_counts = get_class_counts(args.file or sys.stdin, sep=args.delimiter,
+                                processes=args.processes,
+                                cache=args.cache and bool(args.file))
 print_class_dist(class_counts)
@@ -7,14 +7,22 @@ Down-sampling Timbl instances
 Reads Timbl instances from standard input and writes down-sampled instances to
 standard output. Amount of down-sampling can be specified per class.
 
-Example:
+By default, each instance is kept with the probability given for its class, so
+the number of instances per class is only approximately right. With --exact,
+exactly the rounded fraction of the instances of each class is kept, which
+requires reading a file twice, so the instances must be given with --file.
+With --sizes, values are numbers of instances to keep instead of fractions.
+
+Examples:
 $ tt-down-sample.py T:0.1 -d, < ../data/dimin.train 
+$ tt-down-sample.py T:0.1 -d, --exact --seed 1 -f ../data/dimin.train
+$ tt-down-sample.py T:100 E:100 -d, --sizes < ../data/dimin.train 
 """
 
 import sys
 
 from tt.argparse import ArgumentParser, RawDescriptionHelpFormatter
-from tt.sample import sample_down
+from tt.sample import sample_down, sample_down_exact
 
 __author__ = 'Erwin Marsi <e.marsi@gmail.com>'
 __version__ = "0.5"
@@ -27,7 +35,8 @@ parser = ArgumentParser(description=__doc__,
 parser.add_argument("class_fracts",
                     metavar="CLASS:FRACTION",
                     nargs="+",
-                    help="targeted size reduction per class ")
+                    help="targeted size reduction per class "
+                    "(or size with --sizes)")
 
 parser.add_argument("-d", "--delimiter",
                     default=None,
@@ -35,14 +44,52 @@ parser.add_argument("-d", "--delimiter",
                     help="field delimiter in instances "
                     "(default is whitespace)")
 
+parser.add_argument("-e", "--exact",
+                    action="store_true",
+                    help="keep exact fraction of instances per class")
+
+parser.add_argument("-s", "--sizes",
+                    action="store_true",
+                    help="keep exact number of instances per class")
+
+parser.add_argument("-f", "--file",
+                    metavar="FILE",
+                    help="read instances from file, which may be compressed, "
+                    "instead of standard input")
+
+parser.add_argument("--seed",
+                    type=int,
+                    help="seed for random number generator")
+
 args = parser.parse_args()
 
+if args.exact and args.sizes:
+    parser.error("options --exact and --sizes are mutually exclusive")
+
+if args.exact and not args.file:
+    parser.error("option --exact requires --file")
+
 class_fracts = {}
 
 for spec in args.class_fracts:
     class_, fract = spec.split(":")
-    fract = float(fract)
-    assert 0 <= fract <= 1.0
+    
+    if args.sizes:
+        fract = int(fract)
+        assert fract >= 0
+    else:
+        fract = float(fract)
+        assert 0 <= fract <= 1.0
+        
     class_fracts[class_] = fract
 
-sample_down(sys.stdin, class_fracts, sep=args.delimiter)
+inf = args.file or sys.stdin
+
+if args.sizes:
+    sample_down_exact(inf, class_sizes=class_fracts, sep=args.delimiter, 
+                      seed=args.seed)
+elif args.exact:
+    sample_down_exact(inf, class_fracts=class_fracts, sep=args.delimiter, 
+                      seed=args.seed)
+else:
+    sample_down(inf, class_fracts, sep=args.delimiter, seed=args.seed)
@@ -0,0 +1,310 @@
+"""
+Asynchronous Timbl client
+
+Built on the asyncore event loop. Commands return immediately with an
+AsyncResult, while replies are handled when the event loop runs. Many
+commands may be outstanding on a single connection, because they are
+pipelined: the server handles the commands of one connection in order, so
+replies are paired with commands in the same order.
+
+Example:
+
+>>> client = AsyncTimblClient(server.port)
+>>> client.connect()
+>>> results = [ client.classify(inst) for inst in instances ]
+>>> client.wait()
+>>> categories = [ r.get()["CATEGORY"] for r in results ]
+
+Instead of calling wait(), the client can be served by any asyncore loop
+running on the same socket map, e.g. asyncore.loop(map=client.map), together
+with other dispatchers. Several clients may share a map to spread requests
+over several connections. An AsyncTimblClient is not thread-safe: all calls
+must come from the thread running the event loop.
+"""
+
+import asyncore
+import logging
+import socket
+import time
+
+from collections import deque
+
+from tt.exception import TimblClientError
+from tt.client import ( TimblClient, ReplyFramer, parse_classify_reply,
+                        parse_status_reply, check_set_reply )
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncResult(object):
+    """
+    Result of a command to an asynchronous Timbl client, which becomes
+    available once the reply has been received
+    """
+
+    def __init__(self, command, callback=None):
+        self.command = command
+        self.callback = callback
+        self._value = None
+        self._error = None
+        self._ready = False
+
+    def ready(self):
+        """
+        Return true if the reply has been received
+        """
+        return self._ready
+
+    def successful(self):
+        """
+        Return true if the command completed without error
+        """
+        assert self._ready
+        return self._error is None
+
+    def get(self):
+        """
+        Return the result, or raise TimblClientError if the command failed
+        """
+        if not self._ready:
+            raise TimblClientError(
+                "No reply received yet for {0} command".format(self.command))
+        if self._error:
+            raise self._error
+        return self._value
+
+    def _set(self, value=None, error=None):
+        self._value = value
+        self._error = error
+        self._ready = True
+
+        if self.callback:
+            try:
+                self.callback(self)
+            except Exception:
+                # an error in user code must not break the connection and
+                # fail the results of other commands
+                log.exception("Error in callback for {0} command".format(
+                    self.command))
+
+
+
+class AsyncTimblClient(asyncore.dispatcher):
+    """
+    Asynchronous client for a Timbl server
+
+    The classify, query and set methods return an AsyncResult of which the
+    value is the same as the return value of the corresponding TimblClient
+    method. An optional callback is called with the AsyncResult as its only
+    argument once the reply is received.
+    """
+
+    welcome_msg = TimblClient.welcome_msg
+
+    def __init__(self, port, host="localhost", bufsize=2048, map=None,
+                 logger=None, log_tag=None):
+        """
+        @param port: port of Timbl server
+
+        @keyword host: host of Timbl server
+
+        @keyword bufsize: maximum number of bytes received at once
+
+        @keyword map: asyncore socket map, defaults to a new map private to
+        this client
+        """
+        if map is None:
+            map = {}
+        asyncore.dispatcher.__init__(self, map=map)
+        self.map = map
+        self.host = host
+        self.port = port
+        self.bufsize = bufsize
+        self._framer = ReplyFramer()
+        # results waiting for a reply, in the order of the commands sent
+        self._pending = deque()
+        self._out = bytearray()
+        self._closing = False
+        self._open = False
+
+        if logger:
+            self.log = logger
+        else:
+            self.log = logging.getLogger(
+                "{0}.{1}.{2}".format(__name__,
+                                     self.__class__.__name__,
+                                     log_tag or id(self)))
+        self.log.info(
+            "Creating new AsyncTimblClient instance {0}".format(
+                log_tag or id(self)))
+        self.log.info(
+            "server host={0.host}, server port={0.port}".format(self))
+
+    def connect(self, callback=None):
+        """
+        Start connecting to the server
+
+        @return: AsyncResult which becomes ready when the welcome message is
+        received
+        """
+        self.log.debug("Connecting socket")
+        self._framer.clear()
+        self._out = bytearray()
+        self._closing = False
+        self._open = True
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        asyncore.dispatcher.connect(self, (self.host, self.port))
+        result = AsyncResult(None, callback)
+        self._pending.append(result)
+        return result
+
+    def disconnect(self):
+        """
+        Send exit command and close the connection once the replies to all
+        outstanding commands have been received
+        """
+        if self._open and not self._closing:
+            self.log.debug("Disconnecting socket")
+            self._send("exit")
+            self._closing = True
+
+    def classify(self, instance, callback=None):
+        return self._command("classify", "classify " + instance, callback)
+
+    def query(self, callback=None):
+        return self._command("query", "query", callback)
+
+    def set(self, options, callback=None):
+        # the +vk seems to be unsupported in server-mode
+        return self._command("set", "set " + options, callback)
+
+    def outstanding(self):
+        """
+        Return number of commands for which no reply has been received yet
+        """
+        return len(self._pending)
+
+    def wait(self, result=None, timeout=None):
+        """
+        Run the event loop until the given result is ready or, if no result
+        is given, until all outstanding replies are received
+
+        @keyword result: AsyncResult
+
+        @keyword timeout: maximum number of seconds to wait, or None to wait
+        indefinitely
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while ( (result and not result.ready()) or
+                (not result and self._pending) ):
+            if timeout is not None and time.time() > deadline:
+                msg = "Timed out while waiting for replies"
+                self.log.error(msg)
+                raise TimblClientError(msg)
+
+            asyncore.loop(timeout=0.1, map=self.map, count=1)
+
+    # asyncore handlers
+
+    def handle_connect(self):
+        self.log.info("Connection to server established")
+
+    def writable(self):
+        return not self.connected or bool(self._out)
+
+    def handle_write(self):
+        sent = self.send(self._out)
+        del self._out[:sent]
+
+        self._close_when_done()
+
+    def handle_read(self):
+        data = self.recv(self.bufsize)
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Received %r", data)
+
+        self._framer.feed(data)
+
+        while self._pending:
+            result = self._pending[0]
+            reply = self._framer.next_reply(result.command)
+
+            if reply is None:
+                break
+
+            self._pending.popleft()
+            self._handle_reply(result, reply)
+
+        self._close_when_done()
+
+    def handle_close(self):
+        self.close("Connection closed by server")
+
+    def handle_error(self):
+        self.log.exception("Unexpected error")
+        self.close("Connection closed after unexpected error")
+
+    def close(self, msg="Connection closed"):
+        asyncore.dispatcher.close(self)
+        self._open = False
+        self._fail_pending(msg)
+
+    # private
+
+    def _command(self, name, command, callback):
+        if not self._open or self._closing:
+            msg = "Cannot send because Timbl client is not connected"
+            self.log.error(msg)
+            raise TimblClientError(msg)
+
+        self._send(command)
+        result = AsyncResult(name, callback)
+        self._pending.append(result)
+        return result
+
+    def _send(self, command):
+        if not command.endswith("\n"):
+            command += "\n"
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Sending %r", command)
+
+        # actually written by handle_write when the socket is writable
+        self._out += command
+
+    def _handle_reply(self, result, reply):
+        parse = { None: self._check_welcome,
+                  "classify": parse_classify_reply,
+                  "query": parse_status_reply,
+                  "set": check_set_reply }[result.command]
+
+        try:
+            value = parse(reply)
+        except TimblClientError as err:
+            self.log.error(str(err))
+            result._set(error=err)
+        else:
+            result._set(value)
+
+    def _check_welcome(self, reply):
+        if reply.lower() != self.welcome_msg:
+            raise TimblClientError("Unexpected welcome message: " +
+                                   repr(reply))
+
+    def _close_when_done(self):
+        # after disconnect, close once exit is written and all replies are in
+        if ( self._closing and self._open and not self._out and
+             not self._pending ):
+            self.close()
+            self.log.info("Connection to server terminated")
+
+    def _fail_pending(self, msg):
+        if self._pending:
+            self.log.error(msg)
+
+        while self._pending:
+            self._pending.popleft()._set(error=TimblClientError(msg))
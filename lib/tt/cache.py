@@ -0,0 +1,167 @@
+"""
+Sidecar caches of results computed from large files
+
+The result of a full scan of a file, like class counts or instance offsets,
+is saved in a small binary sidecar file next to it, together with the size
+and modification time of the file. The saved result is reused as long as the
+file has the same size and modification time, and is recomputed otherwise.
+
+Example:
+
+>>> counts = cached("dimin.train", "classes", count_classes, key=(",",))
+"""
+
+import cPickle
+import logging
+import os
+import tempfile
+
+
+log = logging.getLogger(__name__)
+
+MAGIC = "TTCACHE1\n"
+
+
+def sidecar_fn(fn, name):
+    """
+    Return default filename of sidecar file with cached result
+
+    @param fn: filename of source file
+
+    @param name: name of cached result
+    """
+    return "{0}.{1}.cache".format(fn, name)
+
+
+def file_stat(fn):
+    """
+    Return tuple of size and modification time of a file
+    """
+    stat = os.stat(fn)
+    return stat.st_size, stat.st_mtime
+
+
+def load(cache_fn, fn, key=None, stat=None):
+    """
+    Load cached result
+
+    @param cache_fn: filename of sidecar file
+
+    @param fn: filename of source file
+
+    @keyword key: any picklable value which identifies how the result was
+    computed from the file, e.g. a tuple of parameters
+
+    @keyword stat: tuple of size and modification time of the file as
+    returned by file_stat, defaults to the current ones
+
+    @return: cached result, or None if there is no valid cached result for
+    the size and modification time of the file and for key
+    """
+    try:
+        cache_f = open(cache_fn, "rb")
+    except IOError:
+        return None
+
+    stat = stat or file_stat(fn)
+
+    with cache_f:
+        try:
+            if cache_f.readline() != MAGIC:
+                raise ValueError("no cache file")
+
+            size, mtime, cached_key = cPickle.load(cache_f)
+
+            if (size, mtime) != stat or cached_key != key:
+                log.info("ignoring outdated cache " + cache_fn)
+                return None
+
+            value = cPickle.load(cache_f)
+        except Exception as err:
+            log.warning("ignoring invalid cache {0}: {1}".format(cache_fn,
+                                                                 err))
+            return None
+
+    log.info("loaded cache " + cache_fn)
+    return value
+
+
+def save(cache_fn, fn, value, key=None, stat=None):
+    """
+    Save result to cache
+
+    @param cache_fn: filename of sidecar file
+
+    @param fn: filename of source file
+
+    @param value: picklable result
+
+    @keyword key: see load
+
+    @keyword stat: tuple of size and modification time of the file when the
+    computation of value started, as returned by file_stat; defaults to the
+    current ones, which is only safe if the file cannot have changed in the
+    meantime
+
+    Failure to save is logged rather than raised, as the cache is only an
+    optimization. The sidecar file is written to a temporary file first and
+    renamed afterwards, so a cache file that exists is always complete.
+    """
+    stat = stat or file_stat(fn)
+
+    try:
+        tmp_file = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(os.path.abspath(cache_fn)),
+            suffix=".tmp", delete=False)
+    except (IOError, OSError) as err:
+        log.warning("cannot save cache {0}: {1}".format(cache_fn, err))
+        return
+
+    try:
+        with tmp_file:
+            tmp_file.write(MAGIC)
+            cPickle.dump(stat + (key,), tmp_file, cPickle.HIGHEST_PROTOCOL)
+            cPickle.dump(value, tmp_file, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(tmp_file.name, cache_fn)
+    except (IOError, OSError, cPickle.PicklingError) as err:
+        log.warning("cannot save cache {0}: {1}".format(cache_fn, err))
+
+        try:
+            os.remove(tmp_file.name)
+        except OSError:
+            pass
+
+        return
+
+    log.info("saved cache " + cache_fn)
+
+
+def cached(fn, name, func, key=None, cache_fn=None):
+    """
+    Return cached result, computing and saving it first if necessary
+
+    @param fn: filename of source file
+
+    @param name: name of cached result, used in the default sidecar filename
+
+    @param func: function without arguments which computes the result
+
+    @keyword key: see load
+
+    @keyword cache_fn: filename of sidecar file, see sidecar_fn for the
+    default
+
+    @return: result
+    """
+    cache_fn = cache_fn or sidecar_fn(fn, name)
+    # the file may change while the result is computed, so the result
+    # belongs to the size and modification time from before
+    stat = file_stat(fn)
+    value = load(cache_fn, fn, key, stat)
+
+    if value is None:
+        value = func()
+        save(cache_fn, fn, value, key, stat)
+
+    return value
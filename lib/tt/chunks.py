@@ -0,0 +1,133 @@
+"""
+Splitting files into chunks for parallel processing
+
+A file is divided into byte ranges of roughly equal size, where every range
+starts at the beginning of a line, so that each range can be read and
+processed independently, e.g. by a separate process.
+
+Example:
+
+>>> for start, end in chunk_ranges("dimin.out", 4, skip_prefix="#"):
+...     lines = read_lines("dimin.out", start, end)
+
+or, to process the chunks in parallel:
+
+>>> results = map_chunks("dimin.out", func, processes=4, skip_prefix="#")
+"""
+
+import multiprocessing
+import os
+
+
+def chunk_ranges(fn, n_chunks, skip_prefix=None):
+    """
+    Split file into byte ranges aligned to line starts
+
+    @param fn: filename
+
+    @param n_chunks: requested number of ranges; fewer ranges are returned
+    when the file is small or has few lines
+
+    @keyword skip_prefix: if given, a range never starts at a line starting
+    with this prefix, e.g. "#" to keep nearest neighbour lines of Timbl output
+    together with their instance
+
+    @return: list of (start, end) tuples of byte offsets, where end is
+    exclusive and the ranges together cover the whole file
+    """
+    size = os.path.getsize(fn)
+    bounds = [0]
+
+    with open(fn, "rb") as f:
+        for i in range(1, n_chunks):
+            pos = size * i // n_chunks
+
+            if pos <= bounds[-1]:
+                continue
+
+            # move to the start of the first line after pos - 1, which is
+            # pos itself if a line ends at pos - 1
+            f.seek(pos - 1)
+            f.readline()
+
+            while True:
+                start = f.tell()
+                line = f.readline()
+
+                if ( not line or not skip_prefix or
+                     not line.startswith(skip_prefix) ):
+                    break
+
+            if bounds[-1] < start < size:
+                bounds.append(start)
+
+    bounds.append(size)
+    return [ (start, end) for start, end in zip(bounds[:-1], bounds[1:])
+             if start < end ]
+
+
+def read_lines(fn, start, end):
+    """
+    Iterate over the lines of a file in a byte range
+
+    @param fn: filename
+
+    @param start: offset of first line
+
+    @param end: offset after the last line
+
+    @return: generator yielding lines, including line endings
+    """
+    with open(fn, "rb") as f:
+        f.seek(start)
+        pos = start
+
+        for line in f:
+            if pos >= end:
+                break
+
+            yield line
+            pos += len(line)
+
+
+def map_chunks(fn, func, args=(), processes=None, skip_prefix=None):
+    """
+    Apply a function to chunks of a file in parallel processes
+
+    @param fn: filename
+
+    @param func: function called as func(lines, *args), where lines is an
+    iterator over the lines of a chunk; must be defined at module level, so
+    it can be pickled
+
+    @keyword args: tuple of extra arguments to func
+
+    @keyword processes: number of worker processes, defaults to the number
+    of cpus
+
+    @keyword skip_prefix: see chunk_ranges
+
+    @return: list of return values of func, in the order of the chunks
+
+    The file is split into one chunk per process. Merging the partial
+    results is up to the caller.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    ranges = chunk_ranges(fn, processes, skip_prefix=skip_prefix)
+    tasks = [ (func, fn, start, end, args) for start, end in ranges ]
+
+    if len(tasks) < 2:
+        return map(_apply_chunk, tasks)
+
+    pool = multiprocessing.Pool(min(processes, len(tasks)))
+
+    try:
+        return pool.map(_apply_chunk, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _apply_chunk(task):
+    func, fn, start, end, args = task
+    return func(read_lines(fn, start, end), *args)
@@ -6,8 +6,17 @@ Timbl client
 # - doc strings
 # - is socket closed after fatal exception?
 
+import itertools
+import json
 import logging
 import socket
+import threading
+import time
+import Queue
+
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
 
 from tt.exception import TimblClientError
 
@@ -24,6 +33,8 @@ class TimblClient(object):
         self.socket = None
         self.timeout = timeout
         self.last_command = None
+        self._framer = ReplyFramer()
+        self._stats = ClientStats()
 
         if logger:
             self.log = logger
@@ -44,11 +55,14 @@ class TimblClient(object):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.settimeout(self.timeout)
         self.socket.connect((self.host, self.port))
-        reply = ""
+        self._framer.clear()
+        reply = self._recv_reply(None)
+        self.log.debug("Server reply is %r", reply)
         
-        while reply.lower() != self.welcome_msg:
-            reply += self._recv()
-            self.log.debug("Server reply is " + repr(reply))
+        if reply.lower() != self.welcome_msg:
+            msg = "Unexpected welcome message: " + repr(reply)
+            self.log.error(msg)
+            raise TimblClientError(msg)
             
         self.log.info("Connection to server established")
                 
@@ -57,7 +71,7 @@ class TimblClient(object):
         # so there is no need to call disconnect from __del__
         if self.socket:
             self.log.debug("Disconnecting socket")
-            self._send("exit")
+            self._send("exit", None)
             self.socket.close()
             self.socket = None
             
@@ -68,124 +82,933 @@ class TimblClient(object):
         self.connect()
         
     def classify(self, instance):
-        self._send("classify " + instance)
-        reply = self._recv()
-        
-        # Reply may be received in arbitrary chunks.
-        # Handling is clumsy/inefficient, because Timbl server protocol 
-        # lacks something like an "ENDCLASSIFY" flag.
-        # Hence we do not know if "{\n" ends a field like "CATEGORY" 
-        # or a neighbor, so we have to check if "NEIGHBORS" is in the reply.   
-        while True:
-            if ( reply.endswith("}\n") and
-                 "NEIGHBORS" not in reply ):
-                break
-            elif reply.endswith("ENDNEIGHBORS\n"):
-                break
-            else:
-                reply += self._recv()
-                
-        if reply.startswith("ERROR {"): 
-            self.log.error("Received " + repr(reply))
-            raise TimblClientError(reply)
-            
-        lines = reply.split("\n")
-        result = {}
+        sent_at = self._send("classify " + instance, "classify")
+        reply = self._recv_reply("classify", sent_at)
+        result = self._parse_classify_reply(reply)
         
-        # FIXME: parsing will fail if accolades are used as classes!
-        for part in lines[0].split("}"):
-            try:
-                key, val = part.split(" {")
-                result[key.strip()] = val.strip()
-            except ValueError:
-                # trailing empty string or "NEIGHBOURS"
-                pass
+        # skip formatting the result unless it is actually logged
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Result = %r", result)
             
-        if len(lines) > 2:
-            result["NEIGHBOURS"] = lines[1:-2]
-        
-        self.log.debug("Result = " + repr(result))
         return result
+    
+    def classify_many(self, instances, window=100):
+        """
+        Classify many instances by pipelining commands
         
-    def query(self):
-        self._send("query")
+        @param instances: iterable of instance strings
         
-        reply = self._recv()   
-        # reply may be incomplete        
-        while not reply.endswith("ENDSTATUS\n"):
-            reply += self._recv()     
+        @keyword window: maximum number of classify commands sent to the
+        server for which no reply has been received yet
         
-        if not reply.startswith("STATUS\n"):
-            self.log.error("Query received ill-formed reply: " + repr(reply))
-            raise TimblClientError("Ill-formed reply: " + repr(reply))
-            
-        status = dict()
+        @return: a generator object which yields (instance, result) pairs in
+        the same order as the instances, where result is a dict as returned
+        by classify()
         
-        for record in reply.split("\n"):
-            try:
-                key, value = record.split(":")
-            except ValueError:
-                # STATUS, ENDSTATUS or empty line
-                continue
-            else:
-                status[key.strip()] = value.strip()
+        Instead of waiting for the reply to each command before sending the
+        next one, up to window commands are written to the socket ahead of
+        reading the replies. This saves a network round trip per instance and
+        keeps the server busy. If the generator is closed before it is
+        exhausted, or an error reply is received, all outstanding replies are
+        read first, so the connection remains usable.
+        """
+        return _classify_pipelined([self], instances, window)
+        
+    def query(self):
+        sent_at = self._send("query", "query")
+        reply = self._recv_reply("query", sent_at)
+        
+        try:
+            status = parse_status_reply(reply)
+        except TimblClientError:
+            self._stats["query"].errors += 1
+            self.log.error("Query received ill-formed reply: " + repr(reply))
+            raise
         
-        self.log.debug("Status = " + repr(status))
+        self.log.debug("Status = %r", status)
         return status
     
     def set(self, options):
         # the +vk seems to be unsupported in server-mode
-        self._send("set " + options + "\n")
+        sent_at = self._send("set " + options + "\n", "set")
+        reply = self._recv_reply("set", sent_at)
         
-        reply = self._recv()
+        try:
+            check_set_reply(reply)
+        except TimblClientError as err:
+            self._stats["set"].errors += 1
+            self.log.error(str(err))
+            raise
         
-        # reply may be incomplete        
-        while not reply.endswith("OK\n"):
-            reply += self._recv()
+        self.log.info("Set options " + repr(options))
         
-        if not reply.strip() == "OK":
-            # this will probably never happen as the server always replies
-            # "OK", even with ill-formed input
-            msg = "Set options received ill-formed reply " + str(reply)
-            self.log.error(msg)
-            raise TimblClientError(msg)
+    def stats(self, reset=False):
+        """
+        Return statistics of commands sent since the client was created
         
-        self.log.info("Set options " + repr(options))
+        @keyword reset: reset all statistics afterwards
+        
+        @return: dict mapping command names ("classify", "query" and "set")
+        to dicts of statistics, see ClientStats.as_dict
+        """
+        stats = self._stats.as_dict()
+        
+        if reset:
+            self._stats.reset()
+            
+        return stats
+    
+    def dump_stats(self, format="json", labels=None):
+        """
+        Return statistics of commands as text
+        
+        @keyword format: either "json" or "prometheus" (i.e. the Prometheus
+        text exposition format)
+        
+        @keyword labels: dict of extra labels added to every Prometheus
+        sample, e.g. to identify the client or server
+        
+        @return: string
+        """
+        if format == "json":
+            return self._stats.to_json()
+        elif format == "prometheus":
+            return self._stats.to_prometheus(labels=labels)
+        else:
+            raise ValueError("unknown stats format " + repr(format))
     
     exit = disconnect
     
     # private
+    
+    def _recv_reply(self, command, sent_at=None):
+        # Reply may be received in arbitrary chunks. When commands are
+        # pipelined, the last chunk may also contain the start of the reply
+        # to the next command, which is kept by the framer for the next call.
+        # Statistics are recorded for the command if the time it was sent is
+        # given.
+        reply = self._framer.next_reply(command)
+        n_recv = n_bytes = 0
+        
+        while reply is None:
+            data = self._recv(command)
+            
+            if not data:
+                msg = ( "Connection closed by server while receiving reply "
+                        "for command: " + repr(self.last_command) )
+                self.log.error(msg)
+                self._stats.error(command)
+                raise TimblClientError(msg)
+            
+            n_recv += 1
+            n_bytes += len(data)
+            self._framer.feed(data)
+            reply = self._framer.next_reply(command)
+            
+        if sent_at is not None:
+            self._stats[command].add_reply(time.time() - sent_at, n_recv,
+                                           n_bytes)
+            
+        return reply
+    
+    def _parse_classify_reply(self, reply):
+        try:
+            return parse_classify_reply(reply)
+        except TimblClientError:
+            self._stats["classify"].errors += 1
+            self.log.error("Received " + repr(reply))
+            raise
         
-    def _send(self, command):
+    def _send(self, command, name):
+        # name is the command name under which statistics are recorded,
+        # or None for no statistics; returns the time of sending
         if not command.endswith("\n"):
             command += "\n"
         self.last_command = command
-        self.log.debug("Sending " + repr(command))
+        
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Sending %r", command)
+            
+        sent_at = time.time()
             
         try:
-            self.socket.send(command)
+            self.socket.sendall(command)
         except AttributeError:
             msg = "Cannot send because Timbl client is not connected"
             self.log.error(msg)
+            self._stats.error(name)
             raise TimblClientError(msg)
         except socket.timeout:
             msg = "Connection timed out while sending command: " + repr(command)
             self.log.error(msg)
+            self._stats.timeout(name)
             raise TimblClientError(msg)
+        
+        if name:
+            self._stats[name].bytes_sent += len(command)
             
-    def _recv(self):  
+        return sent_at
+            
+    def _recv(self, command=None):  
         try:
             reply = self.socket.recv(self.bufsize)
         except AttributeError:
             msg = "Cannot receive because Timbl client is not connected"
             self.log.error(msg)
+            self._stats.error(command)
             raise TimblClientError(msg)
         except socket.timeout:
             msg = ( "Connection timed out while receiving reply for command: " + 
                     repr(self.last_command) )
             self.log.error(msg)
+            self._stats.timeout(command)
             raise TimblClientError(msg)
 
-        self.log.debug("Received " + repr(reply))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Received %r", reply)
+            
         return reply
             
+
+
+
+
+def _classify_pipelined(clients, instances, window, choose=None):
+    # Pipelined classification over one or more connected clients, with up to
+    # window outstanding commands per client. Replies are read in the order
+    # in which commands were sent, which works because a Timbl server handles
+    # the commands of a single connection in order. Function choose is called
+    # with the numbers of outstanding commands per client and returns the
+    # index of the client to send the next instance to; default is
+    # round-robin.
+    assert window > 0
+    
+    if choose is None:
+        turns = itertools.cycle(range(len(clients)))
+        choose = lambda n_pending: next(turns)
+    
+    instances = iter(instances)
+    # (instance, client index, time of sending) triples
+    pending = deque()
+    n_pending = len(clients) * [0]
+    # only true while the connections are known to be in a sane state,
+    # otherwise there is no point in reading outstanding replies 
+    drain = False
+    
+    def send(instance):
+        i = choose(n_pending)
+        sent_at = clients[i]._send("classify " + instance, "classify")
+        n_pending[i] += 1
+        pending.append((instance, i, sent_at))
+    
+    try:
+        for instance in itertools.islice(instances, window * len(clients)):
+            send(instance)
+            
+        while pending:
+            drain = False
+            instance, i, sent_at = pending[0]
+            reply = clients[i]._recv_reply("classify", sent_at)
+            pending.popleft()
+            n_pending[i] -= 1
+            
+            # refill the window before parsing, so the server does not
+            # have to wait for us
+            next_instance = next(instances, None)
+            
+            if next_instance is not None:
+                send(next_instance)
+            
+            drain = True
+            yield instance, clients[i]._parse_classify_reply(reply)
+    finally:
+        # read replies to commands already sent 
+        while drain and pending:
+            instance, i, sent_at = pending.popleft()
+            clients[i]._recv_reply("classify", sent_at)
+            
+
+# parsing of server replies, shared by synchronous and asynchronous clients
+
+def parse_classify_reply(reply):
+    """
+    Parse reply to classify command
+    
+    @param reply: reply string
+    
+    @return: dict with fields like "CATEGORY", "DISTRIBUTION" and "DISTANCE"
+    as keys, plus "NEIGHBOURS" with a list of neighbour lines if the reply
+    includes neighbours
+    """
+    if reply.startswith("ERROR {"): 
+        raise TimblClientError(reply)
+        
+    lines = reply.split("\n")
+    result = {}
+    
+    # FIXME: parsing will fail if accolades are used as classes!
+    for part in lines[0].split("}"):
+        try:
+            key, val = part.split(" {")
+            result[key.strip()] = val.strip()
+        except ValueError:
+            # trailing empty string or "NEIGHBOURS"
+            pass
+        
+    if len(lines) > 2:
+        result["NEIGHBOURS"] = lines[1:-2]
+        
+    return result
+
+
+def parse_status_reply(reply):
+    """
+    Parse reply to query command
+    
+    @param reply: reply string
+    
+    @return: dict of server settings
+    """
+    if not reply.startswith("STATUS\n"):
+        raise TimblClientError("Ill-formed reply: " + repr(reply))
+        
+    status = dict()
+    
+    for record in reply.split("\n"):
+        try:
+            key, value = record.split(":")
+        except ValueError:
+            # STATUS, ENDSTATUS or empty line
+            continue
+        else:
+            status[key.strip()] = value.strip()
+            
+    return status
+
+
+def check_set_reply(reply):
+    """
+    Check reply to set command
+    
+    @param reply: reply string
+    """
+    if not reply.strip() == "OK":
+        raise TimblClientError(
+            "Set options received ill-formed reply " + str(reply))
+
+
+class TimblClientPool(object):
+    """
+    Pool of connected Timbl clients for a single Timbl server
+    
+    Clients are checked out by workers and checked in again when done. New
+    connections are only made when all connected clients are in use, up to
+    the size of the pool. Idle clients are validated with a cheap query
+    before they are handed out again, and broken connections are
+    transparently reconnected.
+    
+    Example:
+    
+    >>> pool = TimblClientPool(server.port, size=4)
+    >>> with pool.client() as client:
+    ...     client.classify(instance)
+    """
+    
+    def __init__(self, port, host="localhost", size=4, max_connect=10,
+                 check_after=30, bufsize=2048, timeout=60, logger=None,
+                 log_tag=None):
+        """
+        @param port: port of Timbl server
+        
+        @keyword host: host of Timbl server
+        
+        @keyword size: maximum number of connected clients
+        
+        @keyword max_connect: maximum number of connections accepted by the
+        Timbl server, i.e. the value of its -C option (which defaults to 10);
+        the pool size is reduced if it exceeds this limit
+        
+        @keyword check_after: idle time in seconds after which a client is
+        validated before it is checked out again
+        
+        @keyword bufsize: bufsize of clients
+        
+        @keyword timeout: timeout of clients
+        """
+        self.host = host
+        self.port = port
+        self.check_after = check_after
+        self.bufsize = bufsize
+        self.timeout = timeout
+        self.log_tag = log_tag or id(self)
+        
+        if logger:
+            self.log = logger
+        else:
+            self.log = logging.getLogger(
+                "{0}.{1}.{2}".format(__name__,
+                                     self.__class__.__name__,
+                                     self.log_tag))
+            
+        if max_connect and size > max_connect:
+            self.log.warning(
+                "Reducing pool size from {0} to server's maximum number of "
+                "connections {1}".format(size, max_connect))
+            size = max_connect
+            
+        self.size = size
+        # idle clients as (client, time of checkin) pairs,
+        # most recently used first
+        self._idle = Queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._n_clients = 0
+        
+        self.log.info(
+            "Creating new TimblClientPool instance {0} of size {1}".format(
+                self.log_tag, self.size))
+        
+    def checkout(self, timeout=None):
+        """
+        Check out a connected client
+        
+        @keyword timeout: maximum time in seconds to wait until a client
+        becomes available when all clients are in use, or None to wait
+        indefinitely
+        
+        @return: TimblClient instance
+        """
+        try:
+            client, last_used = self._idle.get_nowait()
+        except Queue.Empty:
+            client = self._new_client()
+            
+            if client:
+                return client
+            
+            try:
+                client, last_used = self._idle.get(timeout=timeout)
+            except Queue.Empty:
+                msg = "No Timbl client available within {0} seconds".format(
+                    timeout)
+                self.log.error(msg)
+                raise TimblClientError(msg)
+            
+        if time.time() - last_used > self.check_after:
+            self._validate(client)
+            
+        return client
+        
+    def checkin(self, client, suspect=False):
+        """
+        Check in a client that was checked out before
+        
+        @param client: TimblClient instance
+        
+        @keyword suspect: client may be in a bad state (e.g. after an
+        exception), so it must be validated before it is checked out again
+        """
+        if suspect:
+            last_used = 0
+        else:
+            last_used = time.time()
+            
+        self._idle.put((client, last_used))
+        
+    @contextmanager
+    def client(self, timeout=None):
+        """
+        Context manager which checks out a client and checks it in again
+        
+        @keyword timeout: see checkout()
+        """
+        client = self.checkout(timeout)
+        
+        try:
+            yield client
+        except:
+            self.checkin(client, suspect=True)
+            raise
+        else:
+            self.checkin(client)
+            
+    def classify(self, instance):
+        """
+        Classify instance with any available client
+        """
+        with self.client() as client:
+            return client.classify(instance)
+        
+    def close(self):
+        """
+        Disconnect all idle clients
+        """
+        while True:
+            try:
+                client, last_used = self._idle.get_nowait()
+            except Queue.Empty:
+                break
+            
+            try:
+                client.disconnect()
+            except (TimblClientError, socket.error):
+                pass
+            
+            with self._lock:
+                self._n_clients -= 1
+            
+        self.log.info("Closed pool")
+        
+    def _new_client(self):
+        # create and connect a new client, unless the pool is full
+        with self._lock:
+            if self._n_clients >= self.size:
+                return None
+            self._n_clients += 1
+            n = self._n_clients
+            
+        client = TimblClient(self.port, self.host, bufsize=self.bufsize,
+                             timeout=self.timeout,
+                             log_tag="{0}.{1}".format(self.log_tag, n))
+        try:
+            client.connect()
+        except:
+            with self._lock:
+                self._n_clients -= 1
+            raise
+        
+        return client
+    
+    def _validate(self, client):
+        # check if connection is still alive, and reconnect if not
+        try:
+            client.query()
+        except (TimblClientError, socket.error) as err:
+            self.log.warning("Reconnecting broken client: {0}".format(err))
+            
+            if client.socket:
+                client.socket.close()
+                client.socket = None
+                
+            try:
+                client.connect()
+            except:
+                with self._lock:
+                    self._n_clients -= 1
+                raise
+
+
+
+class TimblFarmClient(object):
+    """
+    Client which dispatches classification over a farm of Timbl servers
+    
+    Every server is accessed through its own TimblClientPool. Calls to
+    classify() from different threads are spread over the servers, either
+    round-robin or by sending each instance to the server with the least
+    outstanding requests. Since all servers must behave the same, options
+    should be set when starting the servers rather than through the clients.
+    
+    Example:
+    
+    >>> farm = TimblServerFarm("-i dimin.ibase", n_servers=8)
+    >>> farm.start()
+    >>> client = TimblFarmClient(farm.ports)
+    >>> for inst, result in client.classify_many(instances):
+    ...     print result["CATEGORY"]
+    """
+    
+    policies = ("round-robin", "least-outstanding")
+    
+    def __init__(self, ports, host="localhost", policy="round-robin", size=4,
+                 max_connect=10, check_after=30, bufsize=2048, timeout=60,
+                 logger=None, log_tag=None):
+        """
+        @param ports: ports of Timbl servers
+        
+        @keyword policy: dispatch policy, either "round-robin" or
+        "least-outstanding"
+        
+        @keyword size: pool size per server
+        
+        See TimblClientPool for the other keywords.
+        """
+        if policy not in self.policies:
+            raise ValueError("unknown dispatch policy " + repr(policy))
+        
+        self.policy = policy
+        self.log_tag = log_tag or id(self)
+        
+        if logger:
+            self.log = logger
+        else:
+            self.log = logging.getLogger(
+                "{0}.{1}.{2}".format(__name__,
+                                     self.__class__.__name__,
+                                     self.log_tag))
+        
+        self.pools = [ TimblClientPool(port, host, size=size, 
+                                       max_connect=max_connect,
+                                       check_after=check_after,
+                                       bufsize=bufsize, timeout=timeout,
+                                       log_tag="{0}.{1}".format(self.log_tag,
+                                                                port))
+                       for port in ports ]
+        # number of outstanding requests per server
+        self._outstanding = len(self.pools) * [0]
+        self._turns = itertools.cycle(range(len(self.pools)))
+        self._lock = threading.Lock()
+        
+        self.log.info(
+            "Creating new TimblFarmClient instance {0} for ports {1} with "
+            "{2} dispatch".format(self.log_tag, ports, policy))
+        
+    def classify(self, instance):
+        """
+        Classify instance on one of the servers
+        """
+        with self._lock:
+            i = self._choose(self._outstanding)
+            self._outstanding[i] += 1
+            
+        try:
+            return self.pools[i].classify(instance)
+        finally:
+            with self._lock:
+                self._outstanding[i] -= 1
+                
+    def classify_many(self, instances, window=100):
+        """
+        Classify many instances by pipelining commands to all servers
+        
+        @param instances: iterable of instance strings
+        
+        @keyword window: maximum number of outstanding classify commands per
+        server
+        
+        @return: a generator object which yields (instance, result) pairs in
+        the same order as the instances
+        
+        See also TimblClient.classify_many.
+        """
+        clients = []
+        pairs = None
+        suspect = False
+        
+        try:
+            # check out one by one, so clients already checked out are
+            # checked in again if a later checkout fails
+            for pool in self.pools:
+                clients.append(pool.checkout())
+                
+            pairs = _classify_pipelined(clients, instances, window, 
+                                        self._choose)
+            
+            for pair in pairs:
+                yield pair
+        except Exception:
+            suspect = True
+            raise
+        finally:
+            try:
+                if pairs:
+                    # reads outstanding replies, which may fail
+                    pairs.close()
+            except:
+                suspect = True
+                raise
+            finally:
+                # zip stops at the last client actually checked out
+                for pool, client in zip(self.pools, clients):
+                    pool.checkin(client, suspect)
+                
+    def close(self):
+        """
+        Disconnect all idle clients
+        """
+        for pool in self.pools:
+            pool.close()
+        
+    def _choose(self, outstanding):
+        if self.policy == "round-robin":
+            return next(self._turns)
+        else:
+            return outstanding.index(min(outstanding))
+
+
+class ReplyFramer(object):
+    """
+    Incremental framing of replies from a Timbl server
+    
+    Data received from the socket is appended to a single reusable byte
+    buffer with feed(). A complete reply is taken from the front of the
+    buffer with next_reply(), which returns None as long as the reply is
+    incomplete. Only newly received bytes are scanned for the end of a reply,
+    so the cost of framing is linear in the size of the reply, no matter in
+    how many chunks it arrives. Bytes beyond the end of a reply remain in the
+    buffer as the start of the next reply, as happens when commands are
+    pipelined.
+    
+    The Timbl server protocol lacks something like an "ENDCLASSIFY" flag.
+    Hence we do not know if "}\n" ends a field like "CATEGORY" or a
+    neighbour, so the first line of a classify reply must be checked for
+    "NEIGHBORS", in which case the reply ends with "ENDNEIGHBORS\n".
+    """
+    
+    def __init__(self):
+        self.buffer = bytearray()
+        self._reset()
+        
+    def feed(self, data):
+        """
+        Append received data to the buffer
+        """
+        self.buffer += data
+        
+    def next_reply(self, command):
+        """
+        Take the next complete reply from the buffer
+        
+        @param command: command the reply belongs to, i.e. "classify",
+        "query" or "set", or None for the welcome message
+        
+        @return: reply string, or None if the reply is still incomplete
+        """
+        buf = self.buffer
+        
+        if self._marker is None:
+            # end of first line not yet seen
+            end = buf.find("\n", self._search) + 1
+            
+            if not end:
+                self._search = len(buf)
+                return None
+            elif ( command is None or
+                   buf.startswith("ERROR", 0, end) ):
+                return self._take(end)
+            elif command == "classify":
+                if buf.find("NEIGHBORS", 0, end) == -1:
+                    return self._take(end)
+                self._marker = "\nENDNEIGHBORS\n"
+            elif command == "query":
+                self._marker = "\nENDSTATUS\n"
+            elif command == "set":
+                if buf.startswith("OK\n", 0, end):
+                    return self._take(end)
+                self._marker = "\nOK\n"
+            else:
+                raise ValueError("unknown command " + repr(command))
+            
+            # the marker includes the newline ending the previous line
+            self._search = end - 1
+            
+        marker = self._marker
+        start = buf.find(marker, self._search)
+        
+        if start == -1:
+            # the marker may be split over this and the next chunk
+            self._search = max(self._search, len(buf) - len(marker) + 1)
+            return None
+        
+        return self._take(start + len(marker))
+    
+    def clear(self):
+        """
+        Discard all buffered data
+        """
+        del self.buffer[:]
+        self._reset()
+        
+    def _take(self, end):
+        reply = str(self.buffer[:end])
+        del self.buffer[:end]
+        self._reset()
+        return reply
+    
+    def _reset(self):
+        self._marker = None
+        self._search = 0
+
+
+
+# upper bounds in seconds of the buckets of latency histograms
+LATENCY_BUCKETS = ( 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0 )
+
+
+class CommandStats(object):
+    """
+    Counters and latency histogram of a single command type
+    """
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        @keyword buckets: ascending upper bounds in seconds of latency
+        histogram buckets; a final bucket without upper bound is implied
+        """
+        self.buckets = tuple(buckets)
+        self.reset()
+        
+    def reset(self):
+        # number of replies received
+        self.count = 0
+        self.latency_sum = 0.0
+        self.latency_counts = (len(self.buckets) + 1) * [0]
+        self.recv_calls = 0
+        self.max_recv_calls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.timeouts = 0
+        self.errors = 0
+        
+    def add_reply(self, latency, n_recv, n_bytes):
+        """
+        Record a received reply
+        
+        @param latency: time in seconds between sending the command and
+        receiving the complete reply
+        
+        @param n_recv: number of recv calls on the socket for this reply,
+        which is zero if the reply was already received along with the
+        previous one
+        
+        @param n_bytes: number of bytes received
+        """
+        self.count += 1
+        self.latency_sum += latency
+        self.latency_counts[bisect_left(self.buckets, latency)] += 1
+        self.recv_calls += n_recv
+        self.bytes_received += n_bytes
+        
+        if n_recv > self.max_recv_calls:
+            self.max_recv_calls = n_recv
+            
+    def as_dict(self):
+        """
+        Return statistics as a dict with keys "count", "latency_sum",
+        "latency_buckets" (upper bounds of buckets), "latency_counts"
+        (number of replies per bucket, where the last bucket has no upper
+        bound), "recv_calls", "max_recv_calls", "bytes_sent",
+        "bytes_received", "timeouts" and "errors"
+        """
+        return dict(count=self.count,
+                    latency_sum=self.latency_sum,
+                    latency_buckets=list(self.buckets),
+                    latency_counts=list(self.latency_counts),
+                    recv_calls=self.recv_calls,
+                    max_recv_calls=self.max_recv_calls,
+                    bytes_sent=self.bytes_sent,
+                    bytes_received=self.bytes_received,
+                    timeouts=self.timeouts,
+                    errors=self.errors)
+    
+    
+    
+class ClientStats(object):
+    """
+    Statistics of a Timbl client per command type
+    
+    Timeouts are counted separately from other errors, which include error
+    replies from the server, ill-formed replies and broken connections.
+    """
+    
+    commands = ("classify", "query", "set")
+    
+    # Prometheus metrics as (name, type, help, CommandStats attribute)
+    metrics = (
+        ("recv_calls_total", "counter",
+         "Number of socket recv calls", "recv_calls"),
+        ("sent_bytes_total", "counter",
+         "Number of bytes sent", "bytes_sent"),
+        ("received_bytes_total", "counter",
+         "Number of bytes received", "bytes_received"),
+        ("timeouts_total", "counter",
+         "Number of timeouts", "timeouts"),
+        ("errors_total", "counter",
+         "Number of errors other than timeouts", "errors") )
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self._commands = dict( (name, CommandStats(buckets))
+                               for name in self.commands )
+        
+    def __getitem__(self, command):
+        return self._commands[command]
+    
+    def timeout(self, command):
+        """
+        Count timeout for command, if command is not None
+        """
+        if command:
+            self._commands[command].timeouts += 1
+            
+    def error(self, command):
+        """
+        Count error for command, if command is not None
+        """
+        if command:
+            self._commands[command].errors += 1
+            
+    def reset(self):
+        for stats in self._commands.values():
+            stats.reset()
+            
+    def as_dict(self):
+        """
+        Return dict mapping command names to dicts of statistics as returned
+        by CommandStats.as_dict
+        """
+        return dict( (name, stats.as_dict())
+                     for name, stats in self._commands.items() )
+    
+    def to_json(self):
+        """
+        Return statistics as JSON string
+        """
+        return json.dumps(self.as_dict(), sort_keys=True)
+    
+    def to_prometheus(self, prefix="timbl_client", labels=None):
+        """
+        Return statistics in Prometheus text exposition format
+        
+        @keyword prefix: prefix of metric names
+        
+        @keyword labels: dict of extra labels added to every sample
+        
+        @return: string
+        """
+        labels = sorted((labels or {}).items())
+        lines = []
+        
+        def sample(name, value, command, *extra):
+            label_str = ",".join(
+                '{0}="{1}"'.format(key, str(val).replace("\\", "\\\\")
+                                   .replace('"', '\\"'))
+                for key, val in [("command", command)] + labels + list(extra))
+            lines.append("{0}_{1}{{{2}}} {3}".format(prefix, name,
+                                                     label_str, value))
+            
+        name = "latency_seconds"
+        lines.append("# HELP {0}_{1} Latency of commands".format(prefix,
+                                                                 name))
+        lines.append("# TYPE {0}_{1} histogram".format(prefix, name))
+        
+        for command in self.commands:
+            stats = self._commands[command]
+            cumulative = 0
+            
+            bounds = [ repr(bound) for bound in stats.buckets ] + ["+Inf"]
+            
+            for bound, count in zip(bounds, stats.latency_counts):
+                cumulative += count
+                sample(name + "_bucket", cumulative, command, ("le", bound))
+                
+            sample(name + "_sum", repr(stats.latency_sum), command)
+            sample(name + "_count", stats.count, command)
+            
+        for name, type_, help, attr in self.metrics:
+            lines.append("# HELP {0}_{1} {2}".format(prefix, name, help))
+            lines.append("# TYPE {0}_{1} {2}".format(prefix, name, type_))
+            
+            for command in self.commands:
+                sample(name, getattr(self._commands[command], attr), command)
+                
+        return "\n".join(lines) + "\n"
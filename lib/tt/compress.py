@@ -0,0 +1,304 @@
+"""
+Support for compressed files
+
+Files with a .gz, .bz2, .xz or .zst extension are transparently
+(de)compressed by the corresponding external program, which runs as a
+separate process connected through a pipe. Compression therefore runs
+concurrently with the reading or writing Python code, and on another cpu.
+
+Example:
+
+>>> with open_file("dimin.train.gz") as inf:
+...     for line in inf:
+...         pass
+
+Programs that only accept a filename, like Timbl, can read from and write
+to a compressed file through a named pipe:
+
+>>> with decompress_fifo("dimin.test.gz") as test_fn:
+...     with compress_fifo("dimin.out.gz") as out_fn:
+...         subprocess.call(["Timbl", "-i", "dimin.ibase", "-t", test_fn,
+...                          "-o", out_fn])
+"""
+
+import errno
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from contextlib import contextmanager
+
+
+# compression programs by filename extension
+COMPRESSORS = {".gz": "gzip",
+               ".bz2": "bzip2",
+               ".xz": "xz",
+               ".zst": "zstd"}
+
+# size of blocks copied through named pipes
+BLOCK_SIZE = 1024 * 1024
+
+
+def compressor(fn):
+    """
+    Return name of the compression program for a filename, or None if the
+    filename has no known compression extension
+    """
+    return COMPRESSORS.get(os.path.splitext(fn)[1].lower())
+
+
+def split_ext(fn):
+    """
+    Split compression extension off a filename
+
+    @return: tuple of filename without compression extension and the
+    extension, which is empty if the file is not compressed
+    """
+    root, ext = os.path.splitext(fn)
+
+    if ext.lower() in COMPRESSORS:
+        return root, ext
+    else:
+        return fn, ""
+
+
+def open_file(fn, mode="r", buffering=-1):
+    """
+    Open plain or compressed file
+
+    @param fn: filename, where the extension determines the compression
+
+    @keyword mode: "r" or "w", optionally with "b"; compressed files are
+    always read and written as binary data, and cannot be appended to
+
+    @keyword buffering: buffer size as for the built-in open, where -1 means
+    the system default
+
+    @return: a file object for plain files, or a PipeFile for compressed
+    files
+    """
+    prog = compressor(fn)
+
+    if not prog:
+        return open(fn, mode, buffering)
+
+    # error messages are kept for the exception raised if the process fails
+    errf = tempfile.TemporaryFile()
+    # Other file descriptors are not inherited, as a process holding on to
+    # the write end of someone else's pipe (e.g. a named pipe opened in
+    # another thread) prevents the reader from ever seeing end of file
+
+    if "r" in mode:
+        proc = subprocess.Popen([prog, "-dc", fn], stdout=subprocess.PIPE,
+                                stderr=errf, bufsize=buffering,
+                                close_fds=True)
+        return PipeFile(fn, proc, proc.stdout, errf)
+    elif "w" in mode:
+        with open(fn, "wb") as outf:
+            proc = subprocess.Popen([prog, "-c"], stdin=subprocess.PIPE,
+                                    stdout=outf, stderr=errf,
+                                    bufsize=buffering, close_fds=True)
+        return PipeFile(fn, proc, proc.stdin, errf)
+    else:
+        raise ValueError("unsupported mode for compressed file: " + mode)
+
+
+
+class PipeFile(object):
+    """
+    File object for reading from or writing to a (de)compression process
+
+    Supports iteration over lines, next, read, readline, write, writelines,
+    close and use as a context manager. Closing waits for the process to finish,
+    and raises IOError if it failed.
+    """
+
+    def __init__(self, name, proc, pipe, errf):
+        self.name = name
+        self.proc = proc
+        self._pipe = pipe
+        self._errf = errf
+        self.next = pipe.next
+        self.read = pipe.read
+        self.readline = pipe.readline
+        self.write = pipe.write
+        self.writelines = pipe.writelines
+
+    def __iter__(self):
+        return iter(self._pipe)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._pipe.closed
+
+    def close(self):
+        if self._pipe.closed:
+            return
+
+        # when reading stops before the end of the data, the process fails
+        # on a broken pipe, which is not an error
+        early = self._pipe is self.proc.stdout and self._pipe.read(1)
+        self._pipe.close()
+        returncode = self.proc.wait()
+        self._errf.seek(0)
+        err_msg = self._errf.read().strip()
+        self._errf.close()
+
+        if returncode and not early:
+            raise IOError("{0} exited with code {1} on file {2}: {3}".format(
+                compressor(self.name), returncode, self.name, err_msg))
+
+
+
+@contextmanager
+def decompress_fifo(fn, tmp_dir=None):
+    """
+    Context manager providing a named pipe from which the decompressed data
+    of a file can be read
+
+    @param fn: filename, where the extension determines the compression
+
+    @keyword tmp_dir: directory in which the named pipe is created, defaults
+    to the system's temporary directory
+
+    @return: filename of the named pipe
+
+    The data is decompressed by a separate process while it is read, so no
+    decompressed copy is written to disk. The pipe must be opened for
+    reading only once, and cannot be rewound. This suits programs which read
+    a file once from start to end, like Timbl reading its test instances,
+    but not Timbl reading training instances, which takes more than one
+    pass. On exit, IOError is raised if decompression failed.
+    """
+    fifo_dir = tempfile.mkdtemp(dir=tmp_dir)
+    fifo_fn = os.path.join(fifo_dir, os.path.basename(split_ext(fn)[0]))
+    os.mkfifo(fifo_fn)
+    done = threading.Event()
+    errors = []
+    thread = threading.Thread(target=_feed_fifo,
+                              args=(fn, fifo_fn, done, errors))
+    thread.daemon = True
+    thread.start()
+
+    try:
+        yield fifo_fn
+    finally:
+        done.set()
+        # Keep the pipe open for reading until the feeding thread ends, so
+        # its open does not block, nor its writes once the pipe is full
+        fd = os.open(fifo_fn, os.O_RDONLY | os.O_NONBLOCK)
+
+        try:
+            while thread.is_alive():
+                _drain(fd)
+                thread.join(0.01)
+        finally:
+            os.close(fd)
+            shutil.rmtree(fifo_dir)
+
+    if errors:
+        raise errors[0]
+
+
+@contextmanager
+def compress_fifo(fn, tmp_dir=None):
+    """
+    Context manager providing a named pipe to which data can be written
+    that is compressed to a file
+
+    @param fn: filename, where the extension determines the compression
+
+    @keyword tmp_dir: directory in which the named pipe is created, defaults
+    to the system's temporary directory
+
+    @return: filename of the named pipe
+
+    The data is compressed by a separate process while it is written. The
+    pipe must be opened for writing only once. On exit, which waits for
+    compression to finish, IOError is raised if compression failed. If the
+    pipe was never opened, an empty file is compressed.
+    """
+    fifo_dir = tempfile.mkdtemp(dir=tmp_dir)
+    fifo_fn = os.path.join(fifo_dir, os.path.basename(split_ext(fn)[0]))
+    os.mkfifo(fifo_fn)
+    errors = []
+    thread = threading.Thread(target=_drain_fifo,
+                              args=(fifo_fn, fn, errors))
+    thread.daemon = True
+    thread.start()
+
+    try:
+        yield fifo_fn
+    finally:
+        # The writer is done, so open and close the pipe for writing, which
+        # gives end of file to the thread even if the writer never opened
+        # the pipe. This fails while the thread has not opened the pipe yet
+        # (or already closed it).
+        while thread.is_alive():
+            try:
+                os.close(os.open(fifo_fn, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError as err:
+                if err.errno != errno.ENXIO:
+                    raise
+
+            thread.join(0.01)
+
+        shutil.rmtree(fifo_dir)
+
+    if errors:
+        raise errors[0]
+
+
+def _feed_fifo(fn, fifo_fn, done, errors):
+    # decompress fn to the named pipe, unless done before it is opened
+    # blocks until the pipe is opened for reading
+    fifo = open(fifo_fn, "wb")
+
+    try:
+        if done.is_set():
+            return
+
+        with open_file(fn, "rb") as inf:
+            for block in iter(lambda: inf.read(BLOCK_SIZE), ""):
+                if done.is_set():
+                    break
+
+                fifo.write(block)
+    except EnvironmentError as err:
+        # a broken pipe means the reader stopped early
+        if err.errno != errno.EPIPE:
+            errors.append(err)
+    finally:
+        try:
+            fifo.close()
+        except IOError:
+            pass
+
+
+def _drain_fifo(fifo_fn, fn, errors):
+    # compress data from the named pipe to fn
+    try:
+        # blocks until the pipe is opened for writing
+        with open(fifo_fn, "rb") as fifo:
+            with open_file(fn, "wb") as outf:
+                shutil.copyfileobj(fifo, outf, BLOCK_SIZE)
+    except EnvironmentError as err:
+        errors.append(err)
+
+
+def _drain(fd):
+    # discard data available from a non-blocking file descriptor
+    try:
+        while os.read(fd, BLOCK_SIZE):
+            pass
+    except OSError as err:
+        if err.errno != errno.EAGAIN:
+            raise
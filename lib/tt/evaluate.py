@@ -0,0 +1,237 @@
+"""
+Evaluation of Timbl output
+
+Computes accuracy, per-class precision, recall and F-score, and a confusion
+matrix from Timbl output in a single streaming pass. Class labels are
+interned to integer ids, and counts are kept in integer arrays indexed by
+class id, so memory use depends only on the number of classes.
+
+Example:
+
+>>> cm = evaluate_output("dimin.out", feat_sep=",")
+>>> print cm.accuracy()
+>>> print_scores(cm)
+"""
+
+import sys
+
+from array import array
+
+from tt.outparser import parse_timbl_output, parse_inst, map_output_chunks
+from tt.cache import cached
+from tt.compress import open_file, compressor
+
+
+class ConfusionMatrix(object):
+    """
+    Confusion matrix with true classes as rows and predicted classes as
+    columns
+    """
+
+    def __init__(self):
+        # class labels in order of their ids
+        self.classes = []
+        # mapping of class labels to ids
+        self.class_ids = {}
+        # rows of counts per true class id, indexed by predicted class id
+        self._rows = []
+
+    def class_id(self, class_):
+        """
+        Return id of class label, adding the class if it is new
+        """
+        try:
+            return self.class_ids[class_]
+        except KeyError:
+            id = self.class_ids[class_] = len(self.classes)
+            self.classes.append(class_)
+
+            for row in self._rows:
+                row.append(0)
+
+            self._rows.append(array("L", len(self.classes) * [0]))
+            return id
+
+    def add(self, true_class, pred_class, count=1):
+        """
+        Add count to cell of true and predicted class
+        """
+        self._rows[self.class_id(true_class)][self.class_id(pred_class)] += \
+            count
+
+    def update(self, other):
+        """
+        Add all counts of another confusion matrix
+        """
+        for true_class, row in zip(other.classes, other._rows):
+            for pred_class, count in zip(other.classes, row):
+                if count:
+                    self.add(true_class, pred_class, count)
+
+    def count(self, true_class, pred_class):
+        """
+        Return count of true class predicted as pred_class
+        """
+        try:
+            return self._rows[self.class_ids[true_class]][
+                self.class_ids[pred_class]]
+        except KeyError:
+            return 0
+
+    def total(self):
+        return sum(sum(row) for row in self._rows)
+
+    def correct(self):
+        return sum(row[id] for id, row in enumerate(self._rows))
+
+    def accuracy(self):
+        return self.correct() / float(self.total() or 1)
+
+    def true_count(self, class_):
+        """
+        Return number of instances with class as true class
+        """
+        try:
+            return sum(self._rows[self.class_ids[class_]])
+        except KeyError:
+            return 0
+
+    def pred_count(self, class_):
+        """
+        Return number of instances with class as predicted class
+        """
+        try:
+            id = self.class_ids[class_]
+        except KeyError:
+            return 0
+
+        return sum(row[id] for row in self._rows)
+
+    def precision(self, class_):
+        return self.count(class_, class_) / float(self.pred_count(class_) or 1)
+
+    def recall(self, class_):
+        return self.count(class_, class_) / float(self.true_count(class_) or 1)
+
+    def f_score(self, class_, beta=1.0):
+        precision = self.precision(class_)
+        recall = self.recall(class_)
+        beta2 = beta * beta
+
+        try:
+            return ( (1 + beta2) * precision * recall /
+                     (beta2 * precision + recall) )
+        except ZeroDivisionError:
+            return 0.0
+
+    def rows(self):
+        """
+        Return rows of counts as lists, in the order of the classes
+        """
+        return [ list(row) for row in self._rows ]
+
+
+
+def evaluate_output(timbl_output, feat_sep=None, with_distrib=False,
+                    with_distance=False, processes=1, cache=False):
+    """
+    Evaluate Timbl output
+
+    @param timbl_output: Timbl output filename, possibly of a compressed
+    file, or any container which supports iteration over the output lines
+
+    @keyword feat_sep: feature separator (defaults to whitespace)
+
+    @keyword with_distrib: output includes class distributions (+vdb)
+
+    @keyword with_distance: output includes distances (+vdi)
+
+    @keyword processes: number of processes evaluating chunks of the output
+    in parallel, which requires timbl_output to be the filename of an
+    uncompressed file; None means the number of cpus
+
+    @keyword cache: save the result for an output file in a sidecar file, and
+    reuse it as long as the file is unchanged (see tt.cache)
+
+    @return: ConfusionMatrix instance
+    """
+    if isinstance(timbl_output, basestring):
+        if cache:
+            return cached(timbl_output, "eval",
+                          lambda: evaluate_output(timbl_output, feat_sep,
+                                                  with_distrib, with_distance,
+                                                  processes),
+                          key=(feat_sep, with_distrib, with_distance))
+
+        if processes != 1 and not compressor(timbl_output):
+            cm = ConfusionMatrix()
+
+            for part in map_output_chunks(
+                timbl_output, evaluate_output,
+                (feat_sep, with_distrib, with_distance), processes):
+                cm.update(part)
+
+            return cm
+
+        # closing checks that decompression succeeded
+        with open_file(timbl_output) as f:
+            return evaluate_output(f, feat_sep, with_distrib, with_distance)
+
+    timbl_output = iter(timbl_output)
+    cm = ConfusionMatrix()
+    class_ids = cm.class_ids
+    rows = cm._rows
+
+    for inst_str, k_nn_list in parse_timbl_output(timbl_output):
+        true_class, pred_class = parse_inst(inst_str, feat_sep=feat_sep,
+                                            with_distrib=with_distrib,
+                                            with_distance=with_distance)[1:3]
+        # fast path for known classes
+        try:
+            rows[class_ids[true_class]][class_ids[pred_class]] += 1
+        except KeyError:
+            cm.add(true_class, pred_class)
+
+    return cm
+
+
+def print_scores(cm, out=sys.stdout):
+    """
+    Print accuracy and per-class scores as an ascii table
+    """
+    line = 78 * "-" + "\n"
+    form_str = "{0:>12d}  {1:>12d}  {2:12.8f}  {3:12.8f}  {4:12.8f}    {5}\n"
+    out.write(line)
+    out.write("        TRUE     PREDICTED     PRECISION        RECALL"
+              "       F-SCORE    CLASS\n")
+    out.write(line)
+
+    for class_ in sorted(cm.classes):
+        out.write(
+            form_str.format(
+                cm.true_count(class_),
+                cm.pred_count(class_),
+                cm.precision(class_),
+                cm.recall(class_),
+                cm.f_score(class_),
+                class_))
+
+    out.write(line)
+    out.write("{0:>12d}  {1:>12d}  ACCURACY {2:12.8f}\n".format(
+        cm.total(), cm.correct(), cm.accuracy()))
+
+
+def print_confusion_matrix(cm, out=sys.stdout):
+    """
+    Print confusion matrix as an ascii table with true classes as rows and
+    predicted classes as columns
+    """
+    classes = sorted(cm.classes)
+    width = max([8] + [ len(class_) + 1 for class_ in classes ])
+    out.write("".rjust(width) +
+              "".join(class_.rjust(width) for class_ in classes) + "\n")
+
+    for true_class in classes:
+        out.write(true_class.rjust(width) +
+                  "".join(str(cm.count(true_class, pred_class)).rjust(width)
+                          for pred_class in classes) + "\n")
@@ -11,4 +11,8 @@ class TimblServerError(TimblToolsError):
 
 
 class TimblClientError(TimblToolsError):
-    pass
\ No newline at end of file
+    pass
+
+
+class TimblFileError(TimblToolsError):
+    pass
@@ -0,0 +1,154 @@
+"""
+Splitting instances into folds for cross-validation
+
+Instances are streamed from a single file into k fold files in one pass,
+without keeping instances in memory. The resulting fold files can be passed
+directly to TimblFile.cross_validate.
+
+Example:
+
+>>> fold_fns = split_folds("dimin.train", 10, stratified=True, seed=1)
+>>> TimblFile().cross_validate(fold_fns)
+"""
+
+import os
+import random
+
+from tt.compress import open_file, split_ext
+
+
+def split_folds(inf, k=10, fold_fns=None, out_dir=None, stratified=False,
+                group_key=None, seed=None, sep=None, class_field=-1):
+    """
+    Split instances into k folds
+
+    @param inf: instances as a filename, possibly of a compressed file, or
+    any container which supports iteration over lines
+
+    @keyword k: number of folds
+
+    @keyword fold_fns: list of k fold filenames; by default the filenames
+    are derived from inf, e.g. "x.inst.gz" gives "x.fold0.inst.gz" etc.
+
+    @keyword out_dir: directory for default fold filenames, defaults to the
+    directory of inf
+
+    @keyword stratified: keep the class distribution of every fold close to
+    that of all instances
+
+    @keyword group_key: function mapping an instance line to a key, where
+    instances with the same key always end up in the same fold
+
+    @keyword seed: seed for random number generator, to make the split
+    reproducible
+
+    @keyword sep: feature separator (defaults to whitespace)
+
+    @keyword class_field: index of class field in an instance
+
+    @return: list of fold filenames
+
+    Folds are assigned in blocks of k, where each block is a random
+    permutation of the k folds, so fold sizes differ by at most one. When
+    stratified, there is a sequence of blocks per class, so the number of
+    instances of a class differs by at most one between folds. With group
+    keys, these blocks assign folds to groups instead of instances, so fold
+    sizes are only balanced in terms of numbers of groups. Memory use is
+    proportional to the number of classes and groups, not instances. Output
+    filenames with a compression extension are compressed (see
+    tt.compress).
+    """
+    if not fold_fns:
+        assert isinstance(inf, basestring)
+        fold_fns = fold_filenames(inf, k, out_dir)
+    else:
+        assert len(fold_fns) == k
+
+    if isinstance(inf, basestring):
+        # closing checks that decompression succeeded
+        with open_file(inf) as f:
+            return split_folds(f, k, fold_fns, out_dir, stratified,
+                               group_key, seed, sep, class_field)
+
+    rng = random.Random(seed)
+    # fold generators, one per class if stratified
+    blocks = {}
+    # fold numbers of groups
+    group_folds = {}
+    fold_fs = [ open_file(fn, "w") for fn in fold_fns ]
+    writes = [ f.write for f in fold_fs ]
+
+    try:
+        for l in inf:
+            if not l.strip(): continue
+
+            if stratified:
+                class_ = l.split(sep)[class_field].strip()
+            else:
+                class_ = None
+
+            if group_key:
+                key = group_key(l)
+
+                try:
+                    fold = group_folds[key]
+                except KeyError:
+                    fold = group_folds[key] = _next_fold(blocks, class_, k,
+                                                         rng)
+            else:
+                fold = _next_fold(blocks, class_, k, rng)
+
+            if not l.endswith("\n"):
+                l += "\n"
+
+            writes[fold](l)
+    finally:
+        for f in fold_fs:
+            f.close()
+
+    return fold_fns
+
+
+def fold_filenames(inst_fn, k, out_dir=None):
+    """
+    Return default fold filenames for instance file
+
+    @param inst_fn: instance filename
+
+    @param k: number of folds
+
+    @keyword out_dir: directory of fold files, defaults to directory of
+    inst_fn
+
+    @return: list of k filenames, where e.g. "x.inst.gz" gives
+    "x.fold0.inst.gz" etc.
+    """
+    root, comp_ext = split_ext(inst_fn)
+    root, ext = os.path.splitext(root)
+
+    if out_dir:
+        root = os.path.join(out_dir, os.path.basename(root))
+
+    return [ "{0}.fold{1}{2}{3}".format(root, i, ext, comp_ext)
+             for i in range(k) ]
+
+
+def _next_fold(blocks, class_, k, rng):
+    try:
+        block = blocks[class_]
+    except KeyError:
+        block = blocks[class_] = _balanced_folds(k, rng)
+
+    return block.next()
+
+
+def _balanced_folds(k, rng):
+    # endless sequence of fold numbers in blocks which are random
+    # permutations of range(k)
+    folds = range(k)
+
+    while True:
+        rng.shuffle(folds)
+
+        for fold in folds:
+            yield fold
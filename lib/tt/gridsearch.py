@@ -0,0 +1,321 @@
+"""
+Grid search over Timbl options
+
+Runs a cross-validation experiment for every combination of option values in
+a grid, and records the accuracy of each experiment in a tab-separated
+results table. Experiments already in the table are skipped, so a search that
+died halfway can be resumed by simply running it again.
+
+Example:
+
+>>> grid = [("-k", [1, 3, 5]), ("-m", ["O", "M"]), ("-w", [0, 1])]
+>>> results = grid_search(fold_fns, grid, "results.tab", workers=4)
+"""
+
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from tt.exception import TimblFileError
+from tt.compress import open_file
+from tt.outparser import parse_timbl_output, parse_inst
+from tt.timblfile import TimblFile
+
+
+log = logging.getLogger(__name__)
+
+# columns of results table
+FIELDS = ("options", "accuracy", "correct", "total", "seconds")
+
+# rough relative cost of distance metrics compared to overlap
+METRIC_COST = {"O": 1, "M": 4, "J": 4, "D": 2, "C": 2, "L": 2, "E": 2, "N": 2}
+
+
+def option_grid(grid):
+    """
+    Generate all combinations of option values
+
+    @param grid: sequence of (option, values) pairs, or a dict mapping
+    options to values
+
+    @return: list of Timbl option strings
+
+    Example:
+    >>> option_grid([("-k", [1, 3]), ("-m", ["O", "M"])])
+    ['-k 1 -m O', '-k 1 -m M', '-k 3 -m O', '-k 3 -m M']
+    """
+    return [ _join_options(pairs) for pairs in _combinations(grid) ]
+
+
+def estimate_cost(options):
+    """
+    Rough estimate of the relative cost of an experiment with given Timbl
+    options, used to schedule the longest experiments first
+
+    @param options: Timbl options string
+
+    @return: number, where higher means more expensive
+    """
+    opts = dict(re.findall(r"(-[akm])\s*(\S+)", options))
+
+    try:
+        k = int(opts.get("-k", 1))
+    except ValueError:
+        k = 1
+
+    cost = k * METRIC_COST.get(opts.get("-m", "O")[:1], 1)
+
+    if opts.get("-a", "0") not in ("0", "IB1"):
+        # IGTree and friends are much faster than IB1
+        cost *= 0.1
+
+    return cost
+
+
+def verbosity_levels(options):
+    """
+    Return the verbosity levels switched on by Timbl's +v options
+
+    @param options: Timbl options string
+
+    @return: set of levels like "db" (distributions), "di" (distances) and
+    "n" (neighbours)
+
+    Levels may be combined, as in "+vdb+di", and are switched off again with
+    -v; later options override earlier ones.
+
+    Example:
+    >>> sorted(verbosity_levels("+vdb+di -k 3 -vdb"))
+    ['di']
+    """
+    levels = set()
+
+    for sign, value in re.findall(r"(?:^|\s)([+-])v\s*([a-z][\w+]*)",
+                                  options):
+        for level in value.split("+"):
+            if sign == "+":
+                levels.add(level)
+            else:
+                levels.discard(level)
+
+    levels.discard("")
+    return levels
+
+
+def read_results(results_fn):
+    """
+    Read results table
+
+    @param results_fn: filename of results table
+
+    @return: dict mapping options strings to dicts with the other fields
+    """
+    results = {}
+
+    if not os.path.exists(results_fn):
+        return results
+
+    for line in open(results_fn):
+        record = line.rstrip("\n").split("\t")
+
+        if record[0] == FIELDS[0] or len(record) != len(FIELDS):
+            # header or incomplete line from an interrupted run
+            continue
+
+        options, accuracy, correct, total, seconds = record
+        results[options] = dict(accuracy=float(accuracy),
+                                correct=int(correct),
+                                total=int(total),
+                                seconds=float(seconds))
+
+    return results
+
+
+def score_outputs(out_fns, feat_sep=None, with_distrib=False,
+                  with_distance=False):
+    """
+    Count correctly classified instances in Timbl output files
+
+    @param out_fns: list of Timbl output filenames
+
+    @return: tuple of number of correct instances and total number of
+    instances
+    """
+    correct = total = 0
+
+    for fn in out_fns:
+        # closing checks that decompression succeeded
+        with open_file(fn) as f:
+            for inst_str, k_nn_list in parse_timbl_output(f):
+                true_class, pred_class = parse_inst(
+                    inst_str, feat_sep=feat_sep, with_distrib=with_distrib,
+                    with_distance=with_distance)[1:3]
+                correct += true_class == pred_class
+                total += 1
+
+    return correct, total
+
+
+def grid_search(inst_fns, grid, results_fn, out_dir=None, test_inst_fns=None,
+                timbl_file=None, workers=1, fold_workers=1, ibase_dir=None,
+                train_opts=(), feat_sep=None, cost=estimate_cost):
+    """
+    Run cross-validation for all combinations of option values in a grid
+
+    @param inst_fns: list of instance files, where each file is a fold
+
+    @param grid: sequence of (option, values) pairs, or a dict mapping
+    options to values, e.g. [("-k", [1, 3]), ("-m", ["O", "M"])]
+
+    @param results_fn: filename of results table, to which a line is appended
+    after every completed experiment
+
+    @keyword out_dir: directory for output of experiments, which is written
+    to a subdirectory per experiment; defaults to directory of results table
+
+    @keyword test_inst_fns: see TimblFile.cross_validate
+
+    @keyword timbl_file: TimblFile instance, e.g. with default options
+
+    @keyword workers: number of experiments run at the same time
+
+    @keyword fold_workers: number of folds run at the same time per
+    experiment
+
+    @keyword ibase_dir: directory for cached instance bases, see
+    TimblFile.cross_validate
+
+    @keyword train_opts: options in the grid which apply to training, e.g.
+    ("-a", "-w"); with ibase_dir, these are used as train_options for
+    cross_validate and the other grid options only for testing, so
+    experiments differing only in test options share instance bases
+
+    @keyword feat_sep: feature separator (defaults to whitespace)
+
+    @keyword cost: function estimating the relative cost of an experiment
+    from its options string
+
+    @return: dict mapping options strings to results, including those of
+    previous runs
+
+    Experiments that already have results in the table are skipped. Remaining
+    experiments are started in order of decreasing estimated cost, so the
+    longest experiments do not end up running alone at the end. Experiments
+    that fail are logged and left out of the table, so they are retried when
+    the search is resumed.
+    """
+    timbl_file = timbl_file or TimblFile()
+    out_dir = out_dir or os.path.dirname(os.path.abspath(results_fn))
+    results = read_results(results_fn)
+    # test and train options per options string
+    split_opts = {}
+
+    for pairs in _combinations(grid):
+        split_opts[_join_options(pairs)] = (
+            _join_options(pair for pair in pairs
+                          if pair[0] not in train_opts),
+            _join_options(pair for pair in pairs if pair[0] in train_opts))
+
+    todo = [ opts for opts in option_grid(grid) if opts not in results ]
+    todo.sort(key=cost, reverse=True)
+    log.info("{0} experiments done, {1} to do".format(len(results),
+                                                      len(todo)))
+
+    if not os.path.exists(results_fn) or not os.path.getsize(results_fn):
+        # an empty table is left by a run interrupted before the header was
+        # written
+        with open(results_fn, "w") as results_f:
+            results_f.write("\t".join(FIELDS) + "\n")
+    else:
+        with open(results_fn, "rb+") as results_f:
+            # terminate incomplete line from an interrupted run
+            results_f.seek(-1, os.SEEK_END)
+            
+            if results_f.read(1) != "\n":
+                results_f.write("\n")
+
+    lock = threading.Lock()
+
+    def run(options):
+        start = time.time()
+        exp_dir = os.path.join(out_dir, _dir_name(options))
+
+        if not os.path.exists(exp_dir):
+            os.makedirs(exp_dir)
+
+        # output format follows from all options Timbl runs with
+        levels = verbosity_levels(timbl_file.default_opts + " " + options)
+
+        if ibase_dir:
+            test_options, train_options = split_opts[options]
+        else:
+            # training and testing in a single run with all options
+            test_options, train_options = options, ""
+
+        try:
+            out_fns = timbl_file.cross_validate(
+                inst_fns, test_inst_fns=test_inst_fns, options=test_options,
+                out_dir=exp_dir, workers=fold_workers, ibase_dir=ibase_dir,
+                train_options=train_options)[0]
+            correct, total = score_outputs(out_fns, feat_sep=feat_sep,
+                                           with_distrib="db" in levels,
+                                           with_distance="di" in levels)
+        except (TimblFileError, EnvironmentError, ValueError) as err:
+            log.error("experiment {0!r} failed: {1}".format(options, err))
+            return
+
+        result = dict(accuracy=correct / float(total or 1),
+                      correct=correct,
+                      total=total,
+                      seconds=time.time() - start)
+
+        with lock:
+            results[options] = result
+
+            with open(results_fn, "a") as results_f:
+                results_f.write("{0}\t{accuracy:.6f}\t{correct}\t{total}\t"
+                                "{seconds:.3f}\n".format(options, **result))
+                results_f.flush()
+                os.fsync(results_f.fileno())
+
+        log.info("experiment {0!r}: accuracy={1:.6f}".format(
+            options, result["accuracy"]))
+
+    if todo:
+        pool = ThreadPool(min(workers, len(todo)))
+        # chunksize 1 keeps the order of submission, i.e. longest first
+        pool.map(run, todo, chunksize=1)
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def _combinations(grid):
+    # lists of (option, value) pairs for all combinations of option values
+    if isinstance(grid, dict):
+        grid = sorted(grid.items())
+
+    options = [ opt for opt, values in grid ]
+
+    return [ zip(options, values)
+             for values in itertools.product(*[ values
+                                                for opt, values in grid ]) ]
+
+
+def _join_options(pairs):
+    return " ".join("{0} {1}".format(opt, val) for opt, val in pairs)
+
+
+def _dir_name(options):
+    # directory name for experiment, e.g. "-k 1 -m O +vdb" becomes
+    # "k1_mO_+vdb"
+    parts = [ sign.replace("-", "") + name + value
+              for sign, name, value in re.findall(
+                  r"([-+])(\S+)(?:\s+([^-+\s]\S*))?", options) ]
+    return re.sub(r"[^\w.+:=-]", "_", "_".join(parts)) or "default"
@@ -0,0 +1,247 @@
+"""
+Compact in-memory storage of Timbl instances
+
+An InstanceStore keeps instances in columns, one per feature plus one for
+the class. Each column is dictionary-encoded: every distinct value gets an
+integer code, and the column is an array of codes. Arrays start with one
+byte per code, and are upgraded to two or four bytes when a column gets
+more distinct values. As Timbl features typically have few distinct values,
+this takes far less memory than lines of text or lists of strings.
+
+A store can be saved to a binary file, which loads much faster than parsing
+the instance file again.
+
+Example:
+
+>>> store = read_instances("dimin.train", sep=",")
+>>> store.save("dimin.train.store")
+>>> store = InstanceStore.load("dimin.train.store")
+>>> feats, class_ = store[0]
+>>> store.write("sample.inst", indices=range(0, len(store), 10))
+"""
+
+import cPickle
+import sys
+
+from array import array
+from collections import Counter
+
+from tt.compress import open_file
+from tt.exception import TimblToolsError
+
+
+# typecodes of code arrays in order of increasing size
+TYPECODES = "BHI"
+
+# maximum number of distinct values per typecode
+MAX_VALUES = { "B": 2 ** 8, "H": 2 ** 16, "I": 2 ** 32 }
+
+
+class InstanceStore(object):
+    """
+    Column store of Timbl instances with dictionary-encoded values
+    """
+
+    magic = "TTSTORE1"
+
+    def __init__(self, n_feats, sep=None):
+        """
+        @param n_feats: number of features per instance
+
+        @keyword sep: feature separator used when writing instances
+        (defaults to a space)
+        """
+        self.n_feats = n_feats
+        self.sep = sep
+        # per column (features followed by class): values in order of their
+        # codes, mapping of values to codes, and array of codes
+        self.values = [ [] for i in range(n_feats + 1) ]
+        self.codes = [ {} for i in range(n_feats + 1) ]
+        self.columns = [ array(TYPECODES[0]) for i in range(n_feats + 1) ]
+
+    @property
+    def classes(self):
+        """
+        class labels in order of their codes
+        """
+        return self.values[-1]
+
+    @property
+    def class_column(self):
+        """
+        array of class codes
+        """
+        return self.columns[-1]
+
+    def __len__(self):
+        return len(self.columns[-1])
+
+    def __getitem__(self, i):
+        return self.instance(i)
+
+    def add(self, fields):
+        """
+        Add instance
+
+        @param fields: sequence of feature values followed by the class
+        """
+        if len(fields) != self.n_feats + 1:
+            raise TimblToolsError(
+                "Expected {0} features plus class but got {1} fields".format(
+                    self.n_feats, len(fields)))
+
+        for col, value in enumerate(fields):
+            try:
+                code = self.codes[col][value]
+            except KeyError:
+                code = self._new_code(col, value)
+
+            self.columns[col].append(code)
+
+    def instance(self, i):
+        """
+        Return instance i as a tuple of a list of feature values and a class
+        """
+        fields = [ values[column[i]]
+                   for values, column in zip(self.values, self.columns) ]
+        return fields[:-1], fields[-1]
+
+    def line(self, i):
+        """
+        Return instance i as a line in Timbl format
+        """
+        return (self.sep or " ").join(
+            values[column[i]]
+            for values, column in zip(self.values, self.columns)) + "\n"
+
+    def class_counts(self):
+        """
+        Return Counter mapping classes to counts, as tt.sample's
+        get_class_counts
+        """
+        code_counts = Counter(self.columns[-1])
+        return Counter(dict( (self.classes[code], count)
+                             for code, count in code_counts.items() ))
+
+    def write(self, outf, indices=None):
+        """
+        Write instances in Timbl format
+
+        @param outf: filename, possibly with a compression extension, or file
+
+        @keyword indices: iterable of instance numbers, defaults to all
+        instances
+        """
+        if isinstance(outf, basestring):
+            with open_file(outf, "w") as f:
+                return self.write(f, indices)
+
+        if indices is None:
+            indices = xrange(len(self))
+
+        line = self.line
+        outf.writelines(line(i) for i in indices)
+
+    def save(self, fn):
+        """
+        Save store to a binary file
+        """
+        meta = dict(n_feats=self.n_feats,
+                    sep=self.sep,
+                    values=self.values,
+                    typecodes=[ column.typecode for column in self.columns ],
+                    length=len(self),
+                    byteorder=sys.byteorder)
+
+        with open(fn, "wb") as f:
+            f.write(self.magic + "\n")
+            cPickle.dump(meta, f, cPickle.HIGHEST_PROTOCOL)
+
+            for column in self.columns:
+                column.tofile(f)
+
+    @classmethod
+    def load(cls, fn):
+        """
+        Load store from a binary file saved with the save method
+        """
+        with open(fn, "rb") as f:
+            if f.readline() != cls.magic + "\n":
+                raise TimblToolsError("Not an instance store file: " + fn)
+
+            meta = cPickle.load(f)
+
+            if meta["byteorder"] != sys.byteorder:
+                raise TimblToolsError(
+                    "Instance store file has another byte order: " + fn)
+
+            store = cls(meta["n_feats"], meta["sep"])
+            store.values = meta["values"]
+            store.codes = [ dict((value, code)
+                                 for code, value in enumerate(values))
+                            for values in store.values ]
+
+            for col, typecode in enumerate(meta["typecodes"]):
+                column = array(typecode)
+
+                try:
+                    column.fromfile(f, meta["length"])
+                except EOFError:
+                    raise TimblToolsError(
+                        "Truncated instance store file: " + fn)
+
+                store.columns[col] = column
+
+        return store
+
+    # private
+
+    def _new_code(self, col, value):
+        values = self.values[col]
+        code = self.codes[col][value] = len(values)
+        values.append(value)
+        column = self.columns[col]
+
+        if len(values) > MAX_VALUES[column.typecode]:
+            # upgrade to next larger typecode
+            typecode = TYPECODES[TYPECODES.index(column.typecode) + 1]
+            self.columns[col] = array(typecode, column)
+
+        return code
+
+
+
+def read_instances(inf, sep=None):
+    """
+    Read Timbl instances into an InstanceStore
+
+    @param inf: instances as a filename, possibly of a compressed file, or
+    any container which supports iteration over lines
+
+    @keyword sep: feature separator (defaults to whitespace)
+
+    @return: InstanceStore instance
+    """
+    if isinstance(inf, basestring):
+        # closing checks that decompression succeeded
+        with open_file(inf) as f:
+            return read_instances(f, sep)
+
+    store = None
+
+    for l in inf:
+        fields = l.split(sep)
+
+        if sep is not None:
+            fields[-1] = fields[-1].rstrip()
+
+        if not fields or fields == [""]:
+            continue
+
+        if store is None:
+            store = InstanceStore(len(fields) - 1, sep)
+            add = store.add
+
+        add(fields)
+
+    return store or InstanceStore(0, sep)
@@ -0,0 +1,130 @@
+"""
+Random access to instances in Timbl output
+
+An OutputIndex memory-maps a Timbl output file and records the byte offset
+at which each instance starts, using the same grouping of instance and
+nearest neighbour lines as parse_timbl_output. The offsets are saved in a
+sidecar file, so the output is scanned only once, and any instance can then
+be retrieved without reading the preceding ones.
+
+Example:
+
+>>> index = OutputIndex("dimin.out")
+>>> len(index)
+>>> inst_str, k_nn_list = index.get(1234)
+"""
+
+import logging
+import mmap
+import os
+import re
+
+from array import array
+
+from tt import cache
+
+
+log = logging.getLogger(__name__)
+
+# an instance starts at every line not starting with "#", except at the end
+# of the file
+_INST_START = re.compile(r"\n(?=[^#])")
+
+
+class OutputIndex(object):
+    """
+    Index of instance offsets in a Timbl output file
+    """
+
+    def __init__(self, out_fn, index_fn=None, save=True):
+        """
+        @param out_fn: Timbl output filename; compressed output is not
+        supported, as it cannot be memory-mapped
+
+        @keyword index_fn: filename of sidecar file with the saved index,
+        defaults to out_fn with suffix ".idx"
+
+        @keyword save: save index to sidecar file after building it
+
+        A saved index is only used when size and modification time of the
+        output file are the same as when the index was built; otherwise the
+        index is rebuilt.
+        """
+        self.out_fn = out_fn
+        self.index_fn = index_fn or out_fn + ".idx"
+        self._file = open(out_fn, "rb")
+        stat = os.fstat(self._file.fileno())
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            # empty files cannot be mapped
+            self._map = ""
+
+        # the index must belong to the mapped version of the file
+        stat = (self.size, self.mtime)
+        self.offsets = cache.load(self.index_fn, out_fn, stat=stat)
+
+        if self.offsets is None:
+            self.offsets = self._build()
+
+            if save:
+                cache.save(self.index_fn, out_fn, self.offsets, stat=stat)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        return self.get(i)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, i):
+        """
+        Return instance i
+
+        @param i: instance number, where negative numbers count from the end
+
+        @return: tuple of an instance string and a list of nearest neighbour
+        lines, as yielded by parse_timbl_output
+        """
+        if i < 0:
+            i += len(self.offsets)
+
+        if not 0 <= i < len(self.offsets):
+            raise IndexError("instance number out of range")
+
+        start = self.offsets[i]
+
+        try:
+            end = self.offsets[i + 1]
+        except IndexError:
+            end = self.size
+
+        lines = self._map[start:end].splitlines(True)
+        return lines[0], lines[1:]
+
+    def close(self):
+        if self.size:
+            self._map.close()
+        self._file.close()
+
+    # private
+
+    def _build(self):
+        log.info("building index of " + self.out_fn)
+
+        if not self.size:
+            return array("L")
+
+        offsets = array("L", [0])
+        offsets.extend(match.end() for match in
+                       _INST_START.finditer(self._map))
+        return offsets
@@ -5,8 +5,20 @@ The general idea here is to have lazy parsing in two ways. First, functions
 are generally iterators which yield a first result without analyzing the full
 string. Second, functions parse the input string into its constituents, but
 without descending into parsing these constituents - that's up to the caller.
+
+The exception is parse_output_columns, which parses a whole output file in a
+single pass into compact columnar arrays, for analysis of large outputs.
+Large output files can also be processed in parallel with map_output_chunks.
 """
 
+import re
+
+from array import array
+from cStringIO import StringIO
+
+from tt.chunks import map_chunks
+from tt.compress import open_file
+
             
 def parse_timbl_output(timbl_output):
     """
@@ -85,6 +97,144 @@ def parse_inst(inst_str, feat_sep=None,
 
 
 
+def map_output_chunks(out_fn, func, args=(), processes=None):
+    """
+    Apply a function to chunks of a Timbl output file in parallel processes
+
+    @param out_fn: Timbl output filename, which must not be compressed, as
+    chunks are read at byte offsets
+
+    @param func: function called as func(lines, *args), where lines is an
+    iterator over the lines of a chunk, which can be passed on to
+    parse_timbl_output; must be defined at module level, so it can be pickled
+
+    @keyword args: tuple of extra arguments to func
+
+    @keyword processes: number of worker processes, defaults to the number
+    of cpus
+
+    @return: list of return values of func, in the order of the chunks
+
+    The file is split into one chunk per process, where every chunk starts at
+    an instance line, so nearest neighbour lines stay with their instance.
+    Merging the partial results is up to the caller.
+    """
+    return map_chunks(out_fn, func, args, processes, skip_prefix="#")
+
+
+
+class OutputColumns(object):
+    """
+    Columnar representation of Timbl output, as produced by
+    parse_output_columns
+
+    Instance i has true class classes[true_ids[i]], predicted class
+    classes[pred_ids[i]], distance distances[i] (only if parsed with
+    distance) and feature string feats[feat_offsets[i]:feat_offsets[i+1]].
+    """
+
+    def __init__(self):
+        # class labels in order of their ids
+        self.classes = []
+        # mapping of class labels to ids
+        self.class_ids = {}
+        self.true_ids = array("I")
+        self.pred_ids = array("I")
+        self.distances = array("d")
+        self.feats = ""
+        self.feat_offsets = array("L", [0])
+
+    def __len__(self):
+        return len(self.true_ids)
+
+    def feats_str(self, i):
+        """
+        Return feature string of instance i
+        """
+        return self.feats[self.feat_offsets[i]:self.feat_offsets[i + 1]]
+
+    def true_class(self, i):
+        return self.classes[self.true_ids[i]]
+
+    def pred_class(self, i):
+        return self.classes[self.pred_ids[i]]
+
+
+
+def parse_output_columns(timbl_output, feat_sep=None, with_distrib=False,
+                         with_distance=False):
+    """
+    Parse complete Timbl output into columns
+
+    @param timbl_output: Timbl output filename or any container which
+    supports iteration over the output lines
+
+    @keyword feat_sep: feature separator (defaults to whitespace)
+
+    @keyword with_distrib: output includes class distributions (+vdb)
+
+    @keyword with_distance: output includes distances (+vdi)
+
+    @return: OutputColumns instance
+
+    The output file may be compressed (see tt.compress). Nearest neighbour
+    lines and class distributions are skipped. Rather than
+    building a tuple per instance as parse_inst does, class labels are
+    interned to integer ids and all values are appended to arrays, so memory
+    use stays close to the size of the data itself.
+    """
+    if isinstance(timbl_output, basestring):
+        # closing checks that decompression succeeded
+        with open_file(timbl_output) as f:
+            return parse_output_columns(f, feat_sep, with_distrib,
+                                        with_distance)
+
+    columns = OutputColumns()
+    class_ids = columns.class_ids
+    classes = columns.classes
+    true_ids = columns.true_ids
+    pred_ids = columns.pred_ids
+    distances = columns.distances
+    feat_offsets = columns.feat_offsets
+    feats = StringIO()
+    offset = 0
+
+    for line in timbl_output:
+        if line.startswith("#"):
+            continue
+
+        line = line.rstrip()
+
+        if with_distance:
+            line, distance = line.rsplit(None, 1)
+            distances.append(float(distance))
+
+        if with_distrib:
+            line = line[:line.rindex("{")].rstrip()
+
+        feats_str, true_class, pred_class = line.rsplit(feat_sep, 2)
+
+        try:
+            true_ids.append(class_ids[true_class])
+        except KeyError:
+            true_ids.append(class_ids.setdefault(true_class, len(classes)))
+            classes.append(true_class)
+
+        try:
+            pred_ids.append(class_ids[pred_class])
+        except KeyError:
+            pred_ids.append(class_ids.setdefault(pred_class, len(classes)))
+            classes.append(pred_class)
+
+        feats.write(feats_str)
+        offset += len(feats_str)
+        feat_offsets.append(offset)
+
+    columns.feats = feats.getvalue()
+    return columns
+
+
+
 def parse_feats(feats_str, feat_sep=None):
     """
     Parse features of an instance
@@ -166,4 +316,87 @@ def parse_neighbour_vn_vdb(nn_str, feat_sep=None):
     """
     feats, class_ = nn_str.rsplit("{", 1)
     return feats[2:-1], class_.split()[0]
-    
+
+
+#-------------------------------------------------------------------------------
+# Batch parsing of all nearest neighbours of an instance
+#-------------------------------------------------------------------------------
+
+# The batch parsers join the neighbour lines of an instance and extract all
+# values with a single regular expression search, instead of splitting each
+# line separately. The patterns start with a literal string rather than "^"
+# in multiline mode, which is much slower, as a match is then attempted at
+# every position.
+
+_VK_VDI_NEIGHBOUR = re.compile(r"\t\{ *([^}\n]*?) *\}\t(\S+)")
+
+_VN_VDB_DISTANCE = re.compile(r"distance:[^\t\n]*\t(\S+)")
+
+# requires a newline before the first line
+_VN_VDB_NEIGHBOUR = re.compile(r"\n#\t([^\n]*).\{ *(\S+)")
+
+
+def parse_neighbour_vk_vdi_batch(k_nn_list):
+    """
+    Parse all nearest neighbours as produced with Timbl's +vk +vdi option
+
+    @param k_nn_list: list of nearest neighbour strings of an instance
+
+    @return: tuple of a list of class distributions as strings and an array
+    of distances as floats
+
+    See parse_neighbour_vk_vdi.
+    """
+    pairs = _VK_VDI_NEIGHBOUR.findall("".join(k_nn_list))
+
+    if not pairs:
+        return [], array("d")
+
+    distrib_strs, distances = zip(*pairs)
+    return list(distrib_strs), array("d", map(float, distances))
+
+
+def parse_distance_vn_vdb_batch(k_nn_list):
+    """
+    Parse the distances of all nearest neighbours as produced with Timbl's
+    +vn +vdb option
+
+    @param k_nn_list: list of nearest neighbour strings of an instance
+
+    @return: array of distances as floats, one for every k
+
+    See parse_distance_vn_vdb.
+    """
+    return array("d", map(float,
+                          _VN_VDB_DISTANCE.findall("".join(k_nn_list))))
+
+
+def parse_neighbour_vn_vdb_batch(k_nn_list, class_ids):
+    """
+    Parse all nearest neighbours as produced with Timbl's +vn +vdb option
+
+    @param k_nn_list: list of nearest neighbour strings of an instance
+
+    @param class_ids: dict mapping class labels to integer ids, which is
+    extended with the labels not seen before; pass the same dict for all
+    instances to get consistent ids
+
+    @return: tuple of a list of instance features as strings and an array of
+    class ids
+
+    See parse_neighbour_vn_vdb. Distance lines are skipped; use
+    parse_distance_vn_vdb_batch for these.
+    """
+    pairs = _VN_VDB_NEIGHBOUR.findall("\n" + "".join(k_nn_list))
+
+    if not pairs:
+        return [], array("I")
+
+    feats, classes = zip(*pairs)
+
+    # new labels get ids in order of first occurrence
+    for class_ in classes:
+        if class_ not in class_ids:
+            class_ids[class_] = len(class_ids)
+
+    return list(feats), array("I", map(class_ids.__getitem__, classes))
@@ -10,18 +10,75 @@ Sampling instances
 import sys
 import random
 
+from collections import Counter
 
-def get_class_counts(inf, sep=None, class_field=-1):
+from tt.cache import cached
+from tt.chunks import map_chunks
+from tt.compress import open_file, compressor
+
+
+# size of output buffers of sample_down_multi
+BUFFER_SIZE = 1024 * 1024
+
+
+def get_class_counts(inf, sep=None, class_field=-1, processes=1, cache=False):
+    """
+    Count instances per class
+    
+    @param inf: instances as a filename or any container which supports
+    iteration over lines
+    
+    @keyword processes: number of processes counting chunks of the file in
+    parallel, which requires inf to be the filename of an uncompressed file;
+    None means the number of cpus
+    
+    @keyword cache: save counts of a file in a sidecar file, and reuse them
+    as long as the file is unchanged (see tt.cache)
+    
+    @return: Counter mapping classes to counts
+    """
     if isinstance(inf, basestring):
-        inf = open(inf)
+        if cache:
+            return cached(inf, "classes", 
+                          lambda: get_class_counts(inf, sep, class_field, 
+                                                   processes),
+                          key=(sep, class_field))
         
-    class_counts = {}
+        if processes != 1 and not compressor(inf):
+            class_counts = Counter()
+            
+            for part in map_chunks(inf, get_class_counts, 
+                                   (sep, class_field), processes):
+                class_counts.update(part)
+                
+            return class_counts
         
-    for l in inf:
-        l = l.strip()
-        if not l: continue
-        class_ = l.split(sep)[class_field]
-        class_counts[class_] = class_counts.get(class_, 0) + 1
+        # closing checks that decompression succeeded
+        with open_file(inf) as f:
+            return get_class_counts(f, sep, class_field)
+        
+    class_counts = Counter()
+    
+    if class_field == -1 and sep:
+        # only extract the last field
+        n = len(sep)
+        
+        for l in inf:
+            l = l.strip()
+            if not l: continue
+            i = l.rfind(sep)
+            # a line without separator is a class only, as with split
+            class_counts[l[i + n:] if i >= 0 else l] += 1
+    elif class_field == -1:
+        for l in inf:
+            l = l.strip()
+            if not l: continue
+            class_counts[l.rsplit(None, 1)[-1]] += 1
+    else:
+        for l in inf:
+            l = l.strip()
+            if not l: continue
+            class_counts[l.split(sep)[class_field]] += 1
         
     return class_counts
 
@@ -60,21 +117,233 @@ def print_class_dist(class_counts, out=sys.stdout):
     out.write("{0:16d}\n".format(total))
         
         
-def sample_down(inf, class_fracts={}, sep=None, class_field=-1, outf=sys.stdout):
+def sample_down(inf, class_fracts={}, sep=None, class_field=-1, outf=sys.stdout,
+                seed=None):
     """
     fast but inaccurate down-sampling
+    
+    Every instance is kept with the probability given by the fraction for
+    its class, so the number of instances per class only approximates the
+    targeted size. See sample_down_exact for exact sizes. A seed makes the
+    sample reproducible.
     """
     # what is the distribution of the error?
     if isinstance(inf, basestring):
-        inf = open(inf)
+        # closing checks that decompression succeeded
+        with open_file(inf) as f:
+            return sample_down(f, class_fracts, sep, class_field, outf, seed)
+        
+    rand = _rng(seed).random
+        
+    if isinstance(outf, basestring):
+        outf = open_file(outf, "w")
+        close_outf = True
+    else:
+        close_outf = False
+        
+    for l in inf:
+        l = l.strip()
+        if not l: continue
+        class_ = l.split(sep)[class_field]
+        
+        if rand() < class_fracts.get(class_, 1.0):
+            outf.write(l + "\n")
+            
+    if close_outf:
+        # also waits for compression to finish
+        outf.close()
+        
+        
+def sample_down_multi(inf, profiles, sep=None, class_field=-1, seed=None,
+                      buffer_size=BUFFER_SIZE):
+    """
+    fast but inaccurate down-sampling to several outputs in a single pass
+    
+    @param inf: instances as a filename or any container which supports
+    iteration over lines
+    
+    @param profiles: list of (outf, class_fracts) pairs, where outf is a
+    filename or a file, and class_fracts is as for sample_down
+    
+    @keyword seed: seed for random number generator, to make the samples
+    reproducible
+    
+    @keyword buffer_size: size of write buffer of output files opened here
+    
+    Output filenames with a compression extension are compressed (see
+    tt.compress), each by its own process. A single random number is drawn
+    per instance and compared with the fraction for its class in every
+    profile, so the sample of a profile with smaller fractions is a subset of
+    the sample of a profile with larger fractions, as is usually wanted for
+    learning curves.
+    """
+    if isinstance(inf, basestring):
+        # closing checks that decompression succeeded
+        with open_file(inf, buffering=buffer_size) as f:
+            return sample_down_multi(f, profiles, sep, class_field, seed,
+                                     buffer_size)
+        
+    rand = _rng(seed).random
+    outfs = []
+    opened = []
+        
+    for outf, class_fracts in profiles:
+        if isinstance(outf, basestring):
+            outf = open_file(outf, "w", buffering=buffer_size)
+            opened.append(outf)
+            
+        outfs.append((outf.write, class_fracts))
+        
+    try:
+        for l in inf:
+            l = l.strip()
+            if not l: continue
+            class_ = l.split(sep)[class_field]
+            r = rand()
+            l += "\n"
+            
+            for write, class_fracts in outfs:
+                if r < class_fracts.get(class_, 1.0):
+                    write(l)
+    finally:
+        for outf in opened:
+            # also waits for compression to finish
+            outf.close()
         
+        
+def sample_down_exact(inf, class_sizes=None, class_fracts=None, sep=None, 
+                      class_field=-1, outf=sys.stdout, seed=None):
+    """
+    exact down-sampling
+    
+    @param inf: instances as a filename or a file
+    
+    @keyword class_sizes: dict mapping classes to the number of instances to
+    keep
+    
+    @keyword class_fracts: dict mapping classes to the fraction of instances
+    to keep
+    
+    @keyword seed: seed for random number generator, to make the sample
+    reproducible
+    
+    Either class_sizes or class_fracts must be given. Instances of classes
+    not mentioned are all kept. Each subset of the targeted size of the
+    instances of a class is equally likely to be the sample.
+    
+    With class_sizes, sampling takes a single pass, where a reservoir of
+    instances is kept per class, so memory use is proportional to the sum of
+    the sizes. Instances of other classes are written immediately, and
+    sampled instances are written at the end, in their original order.
+    
+    With class_fracts, the class counts are obtained in a first pass, after
+    which the sizes follow from rounding count times fraction. In the second
+    pass, each instance is selected with probability the number of instances
+    still needed over the number of instances remaining for its class. Memory
+    use is constant and all instances are written in their original order,
+    but inf must be a filename or a seekable file.
+    """
+    assert bool(class_sizes) != bool(class_fracts)
+    
     if isinstance(outf, basestring):
-        outf = open(outf, "w")
+        # closing also waits for compression to finish
+        with open_file(outf, "w") as f:
+            return sample_down_exact(inf, class_sizes, class_fracts, sep,
+                                     class_field, f, seed)
+        
+    rng = _rng(seed)
+        
+    if class_sizes:
+        if isinstance(inf, basestring):
+            # closing checks that decompression succeeded
+            with open_file(inf) as f:
+                _reservoir_sample(f, class_sizes, sep, class_field, outf, 
+                                  rng)
+        else:
+            _reservoir_sample(inf, class_sizes, sep, class_field, outf, rng)
+            
+        return
+    
+    class_counts = get_class_counts(inf, sep, class_field)
+    class_sizes = dict( 
+        (class_, int(round(count * class_fracts.get(class_, 1.0))))
+        for class_, count in class_counts.items() )
+    
+    if hasattr(inf, "seek"):
+        inf.seek(0)
+    else:
+        if not isinstance(inf, basestring):
+            # compressed file, which must be decompressed again
+            inf.close()
+            inf = inf.name
+            
+        with open_file(inf) as f:
+            return _selection_sample(f, class_sizes, class_counts, sep, 
+                                     class_field, outf, rng)
+        
+    _selection_sample(inf, class_sizes, class_counts, sep, class_field, 
+                      outf, rng)
+        
+        
+def _rng(seed):
+    # without seed, use the module's generator, so seeding it with
+    # random.seed() still makes the sample reproducible
+    if seed is None:
+        return random
+    else:
+        return random.Random(seed)
+        
+        
+def _reservoir_sample(inf, class_sizes, sep, class_field, outf, rng):
+    # keep (line number, line) pairs, so sampled lines can be written in
+    # their original order
+    reservoirs = dict( (class_, []) for class_ in class_sizes )
+    seen = dict.fromkeys(class_sizes, 0)
+    randrange = rng.randrange
+    
+    for i, l in enumerate(inf):
+        l = l.strip()
+        if not l: continue
+        class_ = l.split(sep)[class_field]
+        
+        try:
+            reservoir = reservoirs[class_]
+        except KeyError:
+            outf.write(l + "\n")
+            continue
+        
+        seen[class_] += 1
         
+        if len(reservoir) < class_sizes[class_]:
+            reservoir.append((i, l))
+        else:
+            j = randrange(seen[class_])
+            
+            if j < class_sizes[class_]:
+                reservoir[j] = (i, l)
+                
+    sample = [ pair for reservoir in reservoirs.values()
+               for pair in reservoir ]
+    sample.sort()
+    
+    for i, l in sample:
+        outf.write(l + "\n")
+        
+        
+def _selection_sample(inf, class_sizes, class_counts, sep, class_field, outf,
+                      rng):
+    # Knuth's selection sampling (algorithm S) per class 
+    needed = dict(class_sizes)
+    remaining = dict(class_counts)
+    rand = rng.random
+    
     for l in inf:
         l = l.strip()
         if not l: continue
         class_ = l.split(sep)[class_field]
         
-        if random.random() < class_fracts.get(class_, 1.0):
+        if rand() * remaining[class_] < needed[class_]:
             outf.write(l + "\n")
+            needed[class_] -= 1
+            
+        remaining[class_] -= 1
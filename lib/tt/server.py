@@ -15,7 +15,9 @@ import socket
 import signal
 import subprocess
 import tempfile
+import threading
 import time
+import multiprocessing
 
 from tt.exception import TimblServerError
 
@@ -135,11 +137,11 @@ class TimblServer(object):
             try:
                 self.pid = int(open(self.pid_fname).read())
                 break
-            except (OSError, ValueError):
+            except (IOError, OSError, ValueError):
                 self.log.debug("waiting {0} seconds for pid file".format(i+1))
                 time.sleep(1)
         else:
-            msg = "cannot open pidfile {0}".format(self.pid_fname)()
+            msg = "cannot open pidfile {0}".format(self.pid_fname)
             self.log.critical(msg)
             raise TimblServerError(msg)
             
@@ -177,6 +179,126 @@ class TimblServer(object):
     
            
             
+class TimblServerFarm(object):
+    """
+    Farm of Timbl servers which all run with the same options, usually
+    loading the same instance base, so classification can be spread over
+    multiple cores by a TimblFarmClient. Each server listens on its own free
+    port. Servers are killed at exit just like a single TimblServer.
+    """
+    
+    def __init__(self,
+                 timbl_opts,
+                 n_servers=None,
+                 exec_fname="TimblServer",
+                 max_connect=None,
+                 server_log_fname=None,
+                 kill_at_exit=True,
+                 wait_for_dead=True,
+                 wait_time=30,
+                 logger=None,
+                 log_tag=None):
+        """
+        @param timbl_opts: Timbl options shared by all servers, preferably
+        loading a saved instance base with -i
+        
+        @keyword n_servers: number of servers, defaults to number of cpu's
+        
+        @keyword server_log_fname: filename for server logs, which is
+        suffixed with the server's number
+        
+        See TimblServer for the other keywords.
+        """
+        self.timbl_opts = timbl_opts
+        self.n_servers = n_servers or multiprocessing.cpu_count()
+        log_tag = log_tag or id(self)
+        
+        if logger:
+            self.log = logger
+        else:
+            self.log = logging.getLogger(
+                "{0}.{1}.{2}".format(__name__,
+                                     self.__class__.__name__,
+                                     log_tag))
+            
+        self.servers = []
+        
+        for i in range(self.n_servers):
+            if server_log_fname:
+                member_log_fname = "{0}.{1}".format(server_log_fname, i)
+            else:
+                member_log_fname = None
+                
+            self.servers.append(
+                TimblServer(timbl_opts,
+                            exec_fname=exec_fname,
+                            max_connect=max_connect,
+                            server_log_fname=member_log_fname,
+                            kill_at_exit=kill_at_exit,
+                            wait_for_dead=wait_for_dead,
+                            wait_time=wait_time,
+                            logger=logger,
+                            log_tag="{0}.{1}".format(log_tag, i)))
+            
+    @property
+    def ports(self):
+        return [ server.port for server in self.servers ]
+    
+    @property
+    def pids(self):
+        return [ server.pid for server in self.servers ]
+    
+    def start(self):
+        # Pick distinct ports up front, so servers can be started
+        # concurrently. Loading the instance base typically takes most of the
+        # start-up time.
+        ports = set()
+        
+        for server in self.servers:
+            while not server.port or server.port in ports:
+                server.port = server._get_free_port()
+            ports.add(server.port)
+            
+        errors = []
+        
+        def start_server(server):
+            try:
+                server.start()
+            except Exception as err:
+                errors.append(err)
+                
+        threads = [ threading.Thread(target=start_server, args=(server,))
+                    for server in self.servers ]
+        
+        for thread in threads:
+            thread.start()
+            
+        for thread in threads:
+            thread.join()
+            
+        if errors:
+            self.stop()
+            msg = "failed to start {0} of {1} servers:\n{2}".format(
+                len(errors), len(self.servers), errors[0])
+            self.log.critical(msg)
+            raise TimblServerError(msg)
+        
+        self.log.info("started servers on ports {0}".format(self.ports))
+        
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+            
+    def restart(self):
+        self.stop()
+        
+        for server in self.servers:
+            server.port = 0
+            
+        self.start()
+            
+            
+            
 # --- Old code ---------------------------------------------------------------                   
         
 
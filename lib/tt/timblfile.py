@@ -2,10 +2,24 @@
 wraper class for file-based classification with Timbl
 """
 
+import hashlib
+import itertools
 import logging
 import os
 import tempfile
 import subprocess
+import time
+
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+from tt.exception import TimblFileError
+from tt.compress import (open_file, compressor, split_ext, decompress_fifo,
+                         compress_fifo)
+
+
+# size of blocks in which instance files are copied
+BLOCK_SIZE = 1024 * 1024
 
 
 # TODO:
@@ -17,13 +31,38 @@ import subprocess
 class TimblFile(object):
     """
     file-based classification with Timbl
+    
+    Instance and output files may be compressed with gzip, bzip2, xz or
+    zstd, as indicated by their extension (see tt.compress). Timbl itself
+    only reads and writes plain files. Compressed test instances and output
+    are therefore streamed through named pipes, with the (de)compression
+    process on the other end, so they are never stored uncompressed.
+    Training instances cannot be streamed, because Timbl reads them more
+    than once (e.g. to determine the number of features before storing the
+    instances), which a pipe does not allow. Compressed training instances
+    are decompressed into a temporary file instead.
     """
     
-    def __init__(self, timbl_exec="Timbl", default_opts=""):
+    def __init__(self, timbl_exec="Timbl", default_opts="", tmp_dir=None,
+                 fifos=True):
+        """
+        @keyword timbl_exec: Timbl executable
+
+        @keyword default_opts: options passed to every Timbl run
+
+        @keyword tmp_dir: directory for temporary files and named pipes,
+        defaults to the system's temporary directory
+
+        @keyword fifos: stream compressed test instances and output through
+        named pipes; if false, or if the platform lacks named pipes, they
+        are decompressed into and compressed from temporary files
+        """
         # when running under Wing IDI, the shell search path is not available,
         # so the path to the Timbl exec must be specified
         self.timbl_exec = timbl_exec
         self.default_opts = default_opts
+        self.tmp_dir = tmp_dir
+        self.fifos = fifos and hasattr(os, "mkfifo")
         
     # training
         
@@ -31,19 +70,33 @@ class TimblFile(object):
         """
         train on single file and save instance base
         """
+        if log:
+            log_fn = train_inst_fn + ".log"
+        else:
+            log_fn = None
+            
+        self._train(train_inst_fn, inst_base_fn, options, log_fn)
+        return inst_base_fn
+    
+    def _train(self, train_inst_fn, inst_base_fn, options="", log_fn=None):
+        # same as train, but returns Timbl's exit code
+        plain_inst_fn = self._plain_inst_file(train_inst_fn)
         command = "%s %s %s -f %s -I %s" % (
             self.timbl_exec, 
             self.default_opts,
             options,
-            train_inst_fn,
+            plain_inst_fn,
             inst_base_fn)
         
-        if log:
-            command += " >%s.log 2>&1" % train_inst_fn
+        if log_fn:
+            command += " >%s 2>&1" % log_fn
 
-        proc = subprocess.call(command, shell=True, cwd=os.getcwd())
-        
-        return inst_base_fn
+        try:
+            return subprocess.call(command, shell=True, cwd=os.getcwd(),
+                                   close_fds=True)
+        finally:
+            if plain_inst_fn != train_inst_fn:
+                os.remove(plain_inst_fn)
     
     
     def train_multi(self, train_inst_fns, inst_base_fn, options="", log=False):
@@ -62,20 +115,23 @@ class TimblFile(object):
         """
         test on single file with given instance base
         """
-        command = "%s %s %s -t %s -i %s -o %s" % (
-            self.timbl_exec, 
-            self.default_opts,
-            options,
-            test_inst_fn,
-            inst_base_fn)
+        with self._test_inst_file(test_inst_fn) as plain_inst_fn:
+            with self._test_out_file(out_fn) as plain_out_fn:
+                command = "%s %s %s -t %s -i %s" % (
+                    self.timbl_exec, 
+                    self.default_opts,
+                    options,
+                    plain_inst_fn,
+                    inst_base_fn)
+                
+                if out_fn:
+                    command += " -o %s" % plain_out_fn
+                    
+                if log:
+                    command += " >%s.log 2>&1" % test_inst_fn 
         
-        if out_fn:
-            command += " -o %s" % out_fn
-            
-        if log:
-            command += " >%s.log 2>&1" % test_inst_fn 
-
-        proc = subprocess.call(command, shell=True, cwd=os.getcwd())
+                subprocess.call(command, shell=True, cwd=os.getcwd(),
+                                close_fds=True)
         
         return out_fn
     
@@ -87,39 +143,29 @@ class TimblFile(object):
         """
         # use named temp files to prevent filename collisions during parallel execution  
         all_in_f = tempfile.NamedTemporaryFile(prefix="all_in_",
-                                               suffix=".inst", mode="w", delete=False)
-        all_sizes = []
+                                               suffix=".inst", mode="wb", delete=False,
+                                               dir=self.tmp_dir)
         
         # concatenate all test intance files into one big input file,
         # keeping track of their sizes
-        for fn in test_inst_fns:
-            inst = open(fn).readlines()
-            all_sizes.append(len(inst))
-            all_in_f.writelines(inst)
-            
-        all_in_f.close()
+        with all_in_f:
+            all_sizes = self._cat_count_lines(test_inst_fns, all_in_f)
         
         all_out_f = tempfile.NamedTemporaryFile(prefix="all_out_",
-                                                suffix=".inst", mode="w", delete=False)
+                                                suffix=".inst", mode="w", delete=False,
+                                                dir=self.tmp_dir)
         all_out_f.close()
         
         self.test(all_in_f.name, inst_base_fn, all_out_f.name, options, log=log)
 
-        all_out_f = open(all_out_f.name)
-        
         if out_fns is None:
-            out_fns = [ os.path.splitext(fn)[0] + ".out"
-                        for fn in test_inst_fns ]
+            out_fns = [ _out_fn(fn) for fn in test_inst_fns ]
         else:
             assert len(out_fns) == len(test_inst_fns)
 
         # split the output instance files into output parts with sizes
         # according to the corresponding input parts
-        for out_fn, size in zip(out_fns, all_sizes):
-            out = open(out_fn, "w")
-            
-            for i in range(size):
-                out.write(all_out.readline())
+        self._split_lines(all_out_f.name, out_fns, all_sizes)
 
         os.remove(all_in_f.name)
         os.remove(all_out_f.name)
@@ -134,34 +180,52 @@ class TimblFile(object):
         """
         train on single file and test on single file
         """
+        plain_inst_fn = self._plain_inst_file(train_inst_fn)
+        
+        try:
+            out_fn, log_fn, exit_code = self._train_test(
+                "-f " + plain_inst_fn, test_inst_fn, out_fn=out_fn, 
+                log_fn=log_fn, options=options, log=log, out_dir=out_dir)
+        finally:
+            if plain_inst_fn != train_inst_fn:
+                os.remove(plain_inst_fn)
+                
+        return out_fn, log_fn
+    
+    def _train_test(self, train_opt, test_inst_fn, out_fn=None,
+                    log_fn=None, options="", log=False, out_dir=None):
+        # Same as train_test, but also returns Timbl's exit code. The train
+        # option is either "-f" with training instances, or "-i" with a
+        # saved instance base.
         if not out_fn:
-            out_fn = os.path.splitext(test_inst_fn)[0] + ".out" 
-            if out_dir:
-                out_fn = os.path.basename(out_fn)
-                out_fn = os.path.join(out_dir, out_fn)
+            out_fn = _out_fn(test_inst_fn, out_dir)
                
-        command = "%s %s %s -f %s -t %s -o %s" % (
-            self.timbl_exec, 
-            self.default_opts,
-            options,
-            train_inst_fn,
-            test_inst_fn,
-            out_fn)
-        
         if log:
             if not log_fn:
-                log_fn = os.path.splitext(out_fn)[0] + ".log" 
+                log_fn = os.path.splitext(split_ext(out_fn)[0])[0] + ".log" 
                 if out_dir:
                     log_fn = os.path.basename(log_fn)
                     log_fn = os.path.join(out_dir, log_fn)
                 
-            command += " >%s 2>&1" % log_fn
-            
+            redirect = " >%s 2>&1" % log_fn
+        else:
+            redirect = ""
             
-        logging.info(command)
-        proc = subprocess.call(command, shell=True, cwd=os.getcwd())
+        with self._test_inst_file(test_inst_fn) as plain_inst_fn:
+            with self._test_out_file(out_fn) as plain_out_fn:
+                command = "%s %s %s %s -t %s -o %s%s" % (
+                    self.timbl_exec, 
+                    self.default_opts,
+                    options,
+                    train_opt,
+                    plain_inst_fn,
+                    plain_out_fn,
+                    redirect)
+                logging.info(command)
+                exit_code = subprocess.call(command, shell=True, 
+                                            cwd=os.getcwd(), close_fds=True)
         
-        return out_fn, log_fn
+        return out_fn, log_fn, exit_code
     
     
     def train_test_multi(self, train_inst_fns, test_inst_fns, out_fns=None,
@@ -174,23 +238,20 @@ class TimblFile(object):
         # use named temp files to prevent filename collisions during parallel execution  
         all_test_f = tempfile.NamedTemporaryFile(prefix="all_test",
                                                  suffix=".inst", 
-                                                 mode="w", 
-                                                 delete=False)
-        all_sizes = []
+                                                 mode="wb", 
+                                                 delete=False,
+                                                 dir=self.tmp_dir)
         
         # concatenate all test intance files into one big input file,
         # keeping track of their sizes
-        for fn in test_inst_fns:
-            inst = open(fn).readlines()
-            all_sizes.append(len(inst))
-            all_test_f.writelines(inst)
-            
-        all_test_f.close()
+        with all_test_f:
+            all_sizes = self._cat_count_lines(test_inst_fns, all_test_f)
         
         all_out_f = tempfile.NamedTemporaryFile(prefix="all_out",
                                                 suffix=".inst", 
                                                 mode="w", 
-                                                delete=False)
+                                                delete=False,
+                                                dir=self.tmp_dir)
         all_out_f.close()
         
         # out_dir is only for log file, and does not affect the location of
@@ -204,27 +265,15 @@ class TimblFile(object):
                         log=log,
                         out_dir=out_dir)
         
-        all_out_f = open(all_out_f.name)
-        
         if out_fns:
             assert len(out_fns) == len(test_inst_fns)
         else:
             # create output filenames
-            out_fns = []
-            for fn in test_inst_fns:
-                out_fn = os.path.splitext(fn)[0] + ".out" 
-                if out_dir:
-                    out_fn = os.path.basename(out_fn)
-                    out_fn = os.path.join(out_dir, out_fn)
-                out_fns.append(out_fn)
+            out_fns = [ _out_fn(fn, out_dir) for fn in test_inst_fns ]
                         
         # split the output instance files into output parts with sizes
         # according to the corresponding input parts
-        for out_fname, size in zip(out_fns, all_sizes):
-            out_f = open(out_fname, "w")
-            
-            for i in range(size):
-                out_f.write(all_out_f.readline())
+        self._split_lines(all_out_f.name, out_fns, all_sizes)
 
         os.remove(all_train_fname)
         os.remove(all_test_f.name)
@@ -236,7 +285,26 @@ class TimblFile(object):
     # cross validation
     
     def cross_validate(self, inst_fns, test_inst_fns=None, out_fns=None,
-                       log_fns=None, options="", n=None, log=False, out_dir=None):
+                       log_fns=None, options="", n=None, log=False, out_dir=None,
+                       workers=1, ibase_dir=None, train_options=""):
+        """
+        n-fold cross validation, where each instance file is a fold 
+        
+        Folds are independent Timbl runs, so with workers > 1 that many folds
+        are run at the same time. Output and log filenames are returned in
+        the order of the folds, regardless of the number of workers. If any
+        fold fails, the remaining folds are still run, after which a
+        TimblFileError is raised of which the failures attribute maps the
+        number of every failed fold to its exception.
+        
+        If ibase_dir is given, the instance base of each fold is trained once
+        with train_options, saved in ibase_dir, and loaded with -i for
+        testing with options. Saved instance bases are reused by later calls
+        with the same training instances and train_options, so experiments
+        which only vary test options like -k or +v skip training. Instance
+        bases are identified by a hash of the contents of the training files,
+        the Timbl executable and default options, and train_options.
+        """
         # Default is to use the same instance files for training and testing
         # during cross-validation. However, the instance files used for
         # testing may be explicitly specified. This allows for down-sampling
@@ -255,37 +323,251 @@ class TimblFile(object):
         else:
             assert n <= len(inst_fns)
             
-        for i in range(n):
-            train_inst_fn = self._cat_inst_files(
-                inst_fns[:i] + inst_fns[i+1:])
+        if ibase_dir:
+            # hash every file only once, as it is used in n-1 folds
+            digests = [ _file_digest(fn) for fn in inst_fns ]
+        else:
+            digests = None
+            
+        def run_fold(i):
+            try:
+                out_fns[i], log_fns[i] = self._cross_validate_fold(
+                    i, inst_fns, digests, test_inst_fns[i], out_fns[i],
+                    log_fns[i], options, log, out_dir, ibase_dir,
+                    train_options)
+            except Exception as err:
+                logging.error("fold {0} failed: {1}".format(i, err))
+                return err
+            
+        if workers > 1:
+            pool = ThreadPool(min(workers, n))
+            errors = pool.map(run_fold, range(n), chunksize=1)
+            pool.close()
+            pool.join()
+        else:
+            errors = map(run_fold, range(n))
+            
+        failures = dict( (i, err) 
+                         for i, err in enumerate(errors)
+                         if err )
+        
+        if failures:
+            msg = "cross validation failed for fold(s) {0}".format(
+                ", ".join(str(i) for i in sorted(failures)))
+            err = TimblFileError(msg)
+            err.failures = failures
+            raise err
             
-            out_fns[i], log_fns[i] = self.train_test(
-                train_inst_fn,
-                test_inst_fns[i],
-                out_fn=out_fns[i],
+        return out_fns, log_fns
+    
+    def _cross_validate_fold(self, i, inst_fns, digests, test_inst_fn, out_fn,
+                             log_fn, options, log, out_dir, ibase_dir,
+                             train_options):
+        train_inst_fns = inst_fns[:i] + inst_fns[i+1:]
+        
+        if ibase_dir:
+            inst_base_fn = self._cached_inst_base(
+                train_inst_fns, digests[:i] + digests[i+1:], ibase_dir,
+                train_options)
+            train_opt = "-i " + inst_base_fn
+        else:
+            train_inst_fn = self._cat_inst_files(train_inst_fns)
+            train_opt = "-f " + train_inst_fn
+        
+        try:
+            out_fn, log_fn, exit_code = self._train_test(
+                train_opt,
+                test_inst_fn,
+                out_fn=out_fn,
+                log_fn=log_fn,
                 options=options,
                 log=log,
                 out_dir=out_dir)
-
+        finally:
+            if not ibase_dir:
+                os.remove(train_inst_fn)
+            
+        if exit_code:
+            raise TimblFileError(
+                "Timbl exited with code {0}".format(exit_code))
+        
+        return out_fn, log_fn
+    
+    def _cached_inst_base(self, train_inst_fns, digests, ibase_dir,
+                          train_options):
+        # Return filename of instance base trained on the given files,
+        # training and saving it first if it is not in ibase_dir yet
+        key = hashlib.sha1("\0".join([self.timbl_exec, 
+                                      self.default_opts, 
+                                      train_options] + digests)).hexdigest()
+        inst_base_fn = os.path.join(ibase_dir, key + ".ibase")
+        
+        if os.path.exists(inst_base_fn):
+            logging.info("reusing instance base " + inst_base_fn)
+            return inst_base_fn
+        
+        train_inst_fn = self._cat_inst_files(train_inst_fns)
+        # train to a temporary file in the same dir and rename it afterwards,
+        # so an instance base that exists is always complete, even when it is
+        # being built by another process at the same time 
+        tmp_fn = tempfile.NamedTemporaryFile(dir=ibase_dir, suffix=".tmp",
+                                             delete=False).name
+        
+        try:
+            exit_code = self._train(train_inst_fn, tmp_fn, train_options,
+                                    inst_base_fn + ".log")
+            
+            if exit_code:
+                raise TimblFileError(
+                    "Timbl exited with code {0} while training {1}".format(
+                        exit_code, inst_base_fn))
+            
+            os.rename(tmp_fn, inst_base_fn)
+        finally:
             os.remove(train_inst_fn)
             
-        return out_fns, log_fns
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+            
+        logging.info("saved instance base " + inst_base_fn)
+        return inst_base_fn
     
     # support
     
     def _cat_inst_files(self, inst_fns):
         # Use named temp files to prevent filename collisions during parallel execution.
         # Caller is reponsible for deleting the file!
-        all_inst_fn = tempfile.NamedTemporaryFile(suffix=".inst", mode="w",
-                                                  delete=False).name
-        # won't work on windows
+        start = time.time()
+        n_bytes = 0
+        
+        with tempfile.NamedTemporaryFile(suffix=".inst", mode="wb",
+                                         delete=False,
+                                         dir=self.tmp_dir) as all_inst_f:
+            for fn in inst_fns:
+                with open_file(fn, "rb") as inst_f:
+                    n_bytes += _copy_lines(inst_f, all_inst_f)
+                    
+        logging.info("concatenated {0} instance files ({1} bytes) "
+                     "in {2:.3f} seconds".format(len(inst_fns), n_bytes,
+                                                 time.time() - start))
+        return all_inst_f.name
+    
+    def _cat_count_lines(self, inst_fns, outf):
+        # Concatenate instance files to outf, returning the number of lines
+        # per file. Lines are counted while copying in blocks, so memory use
+        # does not depend on the size of the files.
+        sizes = []
+        
         for fn in inst_fns:
-            # might be faster using xargs
-            subprocess.call("cat %s >> %s" % (fn, all_inst_fn), 
-                            shell=True, cwd=os.getcwd())
+            with open_file(fn, "rb") as inst_f:
+                sizes.append(_copy_lines(inst_f, outf, count_lines=True))
+                
+        return sizes
+    
+    def _split_lines(self, fn, out_fns, sizes):
+        # split file into parts with the given numbers of lines
+        with open(fn, "rb") as inf:
+            for out_fn, size in zip(out_fns, sizes):
+                with open_file(out_fn, "wb") as outf:
+                    outf.writelines(itertools.islice(inf, size))
+                    
+    def _plain_inst_file(self, inst_fn):
+        # Return name of a plain file with the instances of inst_fn, which is
+        # a decompressed temporary copy if inst_fn is compressed. Caller is
+        # responsible for deleting the copy! Used for training instances,
+        # which Timbl reads more than once.
+        if compressor(inst_fn):
+            return self._cat_inst_files([inst_fn])
+        else:
+            return inst_fn
+        
+    @contextmanager
+    def _test_inst_file(self, inst_fn):
+        # Provide name of a file from which Timbl reads the test instances of
+        # inst_fn, which is a named pipe or a decompressed temporary copy if
+        # inst_fn is compressed. Timbl reads test instances only once.
+        if compressor(inst_fn) and self.fifos:
+            with decompress_fifo(inst_fn, self.tmp_dir) as fifo_fn:
+                yield fifo_fn
+        else:
+            plain_inst_fn = self._plain_inst_file(inst_fn)
             
-        return all_inst_fn
+            try:
+                yield plain_inst_fn
+            finally:
+                if plain_inst_fn != inst_fn:
+                    os.remove(plain_inst_fn)
+        
+    @contextmanager
+    def _test_out_file(self, out_fn):
+        # Provide name of a file to which Timbl writes output for out_fn,
+        # which is a named pipe or a temporary file compressed to out_fn on
+        # exit if out_fn is compressed
+        if not ( out_fn and compressor(out_fn) ):
+            yield out_fn
+        elif self.fifos:
+            with compress_fifo(out_fn, self.tmp_dir) as fifo_fn:
+                yield fifo_fn
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".out", delete=False,
+                                             dir=self.tmp_dir) as out_f:
+                plain_out_fn = out_f.name
+                
+            try:
+                yield plain_out_fn
+            finally:
+                try:
+                    with open(plain_out_fn, "rb") as inf:
+                        with open_file(out_fn, "wb") as outf:
+                            _copy_lines(inf, outf)
+                finally:
+                    os.remove(plain_out_fn)
     
+    
+    
+def _out_fn(inst_fn, out_dir=None):
+    # default output filename for instance file, e.g. "x.inst.gz" becomes
+    # "x.out.gz", so output is compressed like the instances 
+    root, ext = split_ext(inst_fn)
+    out_fn = os.path.splitext(root)[0] + ".out" + ext
+    
+    if out_dir:
+        out_fn = os.path.join(out_dir, os.path.basename(out_fn))
         
+    return out_fn
+
+
+def _file_digest(fn, block_size=BLOCK_SIZE):
+    # hex digest of file contents
+    digest = hashlib.sha1()
+    
+    with open(fn, "rb") as inf:
+        for block in iter(lambda: inf.read(block_size), ""):
+            digest.update(block)
+            
+    return digest.hexdigest()
+
+
+def _copy_lines(inf, outf, block_size=BLOCK_SIZE, count_lines=False):
+    # Copy file in large blocks, adding a final newline if missing, so
+    # concatenated files never glue two lines together. Returns number of
+    # bytes written, or number of lines if count_lines is true.
+    n_bytes = n_lines = 0
+    block = ""
     
-        
\ No newline at end of file
+    for block in iter(lambda: inf.read(block_size), ""):
+        outf.write(block)
+        n_bytes += len(block)
+        
+        if count_lines:
+            n_lines += block.count("\n")
+        
+    if block and not block.endswith("\n"):
+        outf.write("\n")
+        n_bytes += 1
+        n_lines += 1
+        
+    if count_lines:
+        return n_lines
+    else:
+        return n_bytes
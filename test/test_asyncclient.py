@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test AsyncTimblClient class
+"""
+
+import asyncore
+import unittest
+
+from tt.asyncclient import AsyncTimblClient
+from tt.client import TimblClient, TimblClientError
+
+import test_client
+from common import DATA_DIR
+
+
+class Test_AsyncTimblClient(unittest.TestCase):
+    
+    def setUp(self):
+        if not test_client.SERVER:
+            test_client.start_timbl_server()
+            
+        self.port = test_client.SERVER.port
+        self.client = AsyncTimblClient(self.port)
+        self.client.wait(self.client.connect())
+        
+    def test_query(self):
+        result = self.client.query()
+        self.client.wait(result)
+        self.assertEqual(result.get()["NEIGHBORS"], "1")
+        
+    def test_set(self):
+        self.client.set("-k 10 -d IL")
+        result = self.client.query()
+        self.client.wait()
+        self.assertEqual(result.get()["NEIGHBORS"], "10")
+        self.assertEqual(result.get()["DECAY"], "IL")
+        self.client.set("-k 1 -d Z")
+        self.client.wait()
+        
+    def test_set_error(self):
+        result = self.client.set("-w 1")
+        self.client.wait()
+        self.assertFalse(result.successful())
+        self.assertRaises(TimblClientError, result.get)
+        
+    def test_classify(self):
+        instances = open(DATA_DIR + "/dimin.train").readlines()[:250]
+        sync_client = TimblClient(self.port)
+        sync_client.connect()
+        
+        for vn in "+vn -vn".split():
+            self.client.wait(self.client.set(vn))
+            sync_client.set(vn)
+            results = [ self.client.classify(inst) for inst in instances ]
+            self.assertEqual(self.client.outstanding(), len(instances))
+            self.client.wait()
+            
+            for inst, result in zip(instances, results):
+                self.assertEqual(result.get(), sync_client.classify(inst))
+                
+        self.client.set("-vn")
+        self.client.wait()
+        sync_client.disconnect()
+        
+    def test_classify_error(self):
+        inst = open(DATA_DIR + "/dimin.train").readline()
+        results = [ self.client.classify(inst),
+                    self.client.classify("x, x, x, x"),
+                    self.client.classify(inst) ]
+        self.client.wait()
+        self.assertTrue(results[0].successful())
+        self.assertFalse(results[1].successful())
+        self.assertTrue(results[2].successful())
+        
+    def test_callback(self):
+        categories = []
+        
+        def callback(result):
+            categories.append(result.get()["CATEGORY"])
+            
+        for inst in open(DATA_DIR + "/dimin.train").readlines()[:10]:
+            self.client.classify(inst, callback)
+            
+        self.client.wait()
+        self.assertEqual(len(categories), 10)
+        
+    def test_shared_map(self):
+        other = AsyncTimblClient(self.port, map=self.client.map)
+        other.connect()
+        results = [ client.query() for client in (self.client, other) ]
+        self.client.wait()
+        other.wait()
+        self.assertTrue(all(result.get() for result in results))
+        other.disconnect()
+        
+    def test_disconnect(self):
+        self.client.disconnect()
+        self.client.wait(timeout=10)
+        self.assertRaises(TimblClientError, self.client.query)
+        
+    def test_classify_disconnect(self):
+        # replies to commands sent before disconnecting are still received
+        instances = open(DATA_DIR + "/dimin.train").readlines()[:5]
+        results = [ self.client.classify(inst) for inst in instances ]
+        self.client.disconnect()
+        self.client.wait(timeout=10)
+        self.assertTrue(all(result.successful() for result in results))
+        self.assertFalse(self.client.outstanding())
+        # the connection is closed once all replies are received
+        for i in range(10):
+            asyncore.loop(timeout=0.1, map=self.client.map, count=1)
+        self.assertFalse(self.client.map)
+        
+    def test_callback_error(self):
+        def callback(result):
+            raise ValueError("bug in callback")
+        
+        inst = open(DATA_DIR + "/dimin.train").readline()
+        results = [ self.client.classify(inst, callback),
+                    self.client.classify(inst) ]
+        self.client.wait(timeout=10)
+        self.assertTrue(all(result.successful() for result in results))
+        self.client.wait(self.client.query(), timeout=10)
+        
+    def tearDown(self):
+        self.client.disconnect()
+        
+        
+        
+
+if __name__ == '__main__':
+    import sys
+    sys.argv.append("-v")
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test sidecar caches
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt.cache import load, save, cached, sidecar_fn
+from tt.evaluate import evaluate_output
+from tt.sample import get_class_counts
+
+from common import DATA_DIR
+
+
+class Test_cache(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tmp_dir, "dimin.train")
+        shutil.copy(DATA_DIR + "/dimin.train", self.fn)
+        self.cache_fn = sidecar_fn(self.fn, "test")
+        self.calls = 0
+        
+    def compute(self):
+        self.calls += 1
+        return {"answer": 42}
+        
+    def test_load_save(self):
+        self.assertEqual(load(self.cache_fn, self.fn), None)
+        save(self.cache_fn, self.fn, [1, 2], key=("a", 1))
+        self.assertEqual(load(self.cache_fn, self.fn, key=("a", 1)), [1, 2])
+        # other key
+        self.assertEqual(load(self.cache_fn, self.fn, key=("b", 1)), None)
+        # invalid cache
+        open(self.cache_fn, "w").write("garbage")
+        self.assertEqual(load(self.cache_fn, self.fn), None)
+        
+    def test_cached(self):
+        for i in range(3):
+            self.assertEqual(cached(self.fn, "test", self.compute), 
+                             {"answer": 42})
+            
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(os.path.exists(self.cache_fn))
+        
+        # changed file
+        open(self.fn, "a").write("a,b,c\n")
+        cached(self.fn, "test", self.compute)
+        self.assertEqual(self.calls, 2)
+        
+    def test_cached_growing_file(self):
+        # result computed while the file grows belongs to the old version
+        def compute():
+            open(self.fn, "a").write("a,b,c\n")
+            return self.compute()
+        
+        cached(self.fn, "test", compute)
+        cached(self.fn, "test", self.compute)
+        self.assertEqual(self.calls, 2)
+        
+    def test_save_failure(self):
+        # failure to pickle is logged, and leaves no temporary file behind
+        save(self.cache_fn, self.fn, lambda: None)
+        self.assertFalse(os.path.exists(self.cache_fn))
+        self.assertEqual(os.listdir(self.tmp_dir), ["dimin.train"])
+        
+    def test_class_counts(self):
+        counts = get_class_counts(self.fn, sep=",", cache=True)
+        self.assertTrue(os.path.exists(sidecar_fn(self.fn, "classes")))
+        self.assertEqual(get_class_counts(self.fn, sep=",", cache=True), 
+                         counts)
+        self.assertEqual(get_class_counts(self.fn, sep=","), counts)
+        
+    def test_evaluate(self):
+        out_fn = os.path.join(self.tmp_dir, "sample.out")
+        shutil.copy(DATA_DIR + "/sample.out", out_fn)
+        
+        for i in range(2):
+            cm = evaluate_output(out_fn, feat_sep=",", with_distrib=True,
+                                 cache=True)
+            self.assertEqual(cm.total(), 3)
+            self.assertEqual(cm.accuracy(), 1.0)
+            
+        self.assertTrue(os.path.exists(sidecar_fn(out_fn, "eval")))
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+        
+
+if __name__ == '__main__':
+    unittest.main()
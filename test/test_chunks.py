@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test splitting files into chunks
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt.chunks import chunk_ranges, read_lines
+
+from common import DATA_DIR
+
+
+class Test_chunks(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_fn = os.path.join(self.tmp_dir, "sample.out")
+        
+        with open(self.out_fn, "w") as out_file:
+            for i in range(25):
+                out_file.write(open(DATA_DIR + "/sample.out").read())
+                
+        self.data = open(self.out_fn).read()
+    
+    def test_chunk_ranges(self):
+        for n in 1, 2, 7, 100, 10000:
+            ranges = chunk_ranges(self.out_fn, n)
+            self.assertTrue(len(ranges) <= n)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(self.data))
+            
+            for (start, end), (next_start, next_end) in zip(ranges, 
+                                                            ranges[1:]):
+                self.assertEqual(end, next_start)
+                self.assertEqual(self.data[start - 1], "\n")
+            
+    def test_skip_prefix(self):
+        ranges = chunk_ranges(self.out_fn, 50, skip_prefix="#")
+        self.assertTrue(len(ranges) > 1)
+        
+        for start, end in ranges:
+            self.assertNotEqual(self.data[start], "#")
+            
+    def test_read_lines(self):
+        ranges = chunk_ranges(self.out_fn, 7)
+        lines = []
+        
+        for start, end in ranges:
+            lines += list(read_lines(self.out_fn, start, end))
+            
+        self.assertEqual(lines, open(self.out_fn).readlines())
+        
+    def test_empty(self):
+        open(self.out_fn, "w").close()
+        self.assertEqual(chunk_ranges(self.out_fn, 4), [])
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+        
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,11 +4,14 @@
 test TimblClient class
 """
 
+import json
 import logging
+import socket
 import unittest
 
-from tt.server import TimblServer
-from tt.client import TimblClient, TimblClientError
+from tt.server import TimblServer, TimblServerFarm
+from tt.client import ( TimblClient, TimblClientError, TimblClientPool,
+                        TimblFarmClient, ReplyFramer, ClientStats )
 
 from common import DATA_DIR
 
@@ -113,6 +116,37 @@ class Test_TimblClient(unittest.TestCase):
                         
 
         
+    def test_classify_many(self):
+        instances = open(DATA_DIR + "/dimin.train").readlines()[:250]
+
+        for vn in "+vn -vn".split():
+            self.client.set(vn)
+            results = list(self.client.classify_many(instances, window=16))
+            self.assertEqual(len(results), len(instances))
+
+            for inst, (pipelined_inst, result) in zip(instances, results):
+                self.assertEqual(inst, pipelined_inst)
+                self.assertEqual(result, self.client.classify(inst))
+
+        self.client.set("-vn")
+
+    def test_classify_many_close(self):
+        instances = open(DATA_DIR + "/dimin.train").readlines()[:100]
+        results = self.client.classify_many(instances, window=50)
+        results.next()
+        results.close()
+        # outstanding replies must have been consumed
+        status = self.client.query()
+        self.assertEqual(status["NEIGHBORS"], "1")
+
+    def test_classify_many_error(self):
+        instances = open(DATA_DIR + "/dimin.train").readlines()[:10]
+        instances.insert(5, "x, x, x, x")
+        self.assertRaises(TimblClientError,
+                          list,
+                          self.client.classify_many(instances))
+        self.client.query()
+
     def test_classify_error(self):
         self.assertRaises(TimblClientError, 
                           self.client.classify,
@@ -154,13 +188,297 @@ class Test_TimblClient(unittest.TestCase):
         # global reset of logging level
         logging.getLogger().setLevel(logging.CRITICAL)
 
+    def test_stats(self):
+        instances = open(DATA_DIR + "/dimin.train").readlines()[:10]
+        
+        for inst in instances[:5]:
+            self.client.classify(inst)
+            
+        for inst, result in self.client.classify_many(instances[5:]):
+            pass
+        
+        self.assertRaises(TimblClientError, self.client.classify, "x, x")
+        self.client.query()
+        self.assertRaises(TimblClientError, self.client.set, "-w 1")
+        
+        stats = self.client.stats()
+        self.assertEqual(stats["classify"]["count"], 11)
+        self.assertEqual(stats["classify"]["errors"], 1)
+        self.assertEqual(sum(stats["classify"]["latency_counts"]), 11)
+        self.assertTrue(stats["classify"]["latency_sum"] > 0)
+        self.assertTrue(stats["classify"]["recv_calls"] >= 1)
+        self.assertEqual(stats["classify"]["bytes_sent"],
+                         sum(len("classify " + inst) for inst in instances) +
+                         len("classify x, x\n"))
+        self.assertTrue(stats["classify"]["bytes_received"] > 0)
+        self.assertEqual(stats["query"]["count"], 1)
+        self.assertEqual(stats["query"]["errors"], 0)
+        self.assertEqual(stats["set"]["count"], 1)
+        self.assertEqual(stats["set"]["errors"], 1)
+        self.assertEqual(stats["set"]["timeouts"], 0)
+        
+        self.assertEqual(json.loads(self.client.dump_stats()), stats)
+        self.client.stats(reset=True)
+        self.assertEqual(self.client.stats()["classify"]["count"], 0)
+        
+    def test_stats_timeout(self):
+        self.client.socket.settimeout(1)
+        self.assertRaises(TimblClientError, self.client.set, "-k")
+        self.client.socket.settimeout(10)
+        self.assertEqual(self.client.stats()["set"]["timeouts"], 1)
+        
+        
+        
+    def tearDown(self):
+        self.client.disconnect()
+        
+
+
+class Test_TimblClientPool(unittest.TestCase):
+    
+    def setUp(self):
+        if not SERVER:
+            start_timbl_server()
+            
+        self.pool = TimblClientPool(SERVER.port, size=2)
+        
+    def test_checkout_checkin(self):
+        client1 = self.pool.checkout()
+        client2 = self.pool.checkout()
+        self.assertNotEqual(client1, client2)
+        # pool is exhausted
+        self.assertRaises(TimblClientError, self.pool.checkout, timeout=0.1)
+        self.pool.checkin(client1)
+        self.assertEqual(self.pool.checkout(), client1)
+        self.pool.checkin(client1)
+        self.pool.checkin(client2)
+        
+    def test_max_connect(self):
+        pool = TimblClientPool(SERVER.port, size=20, max_connect=5)
+        self.assertEqual(pool.size, 5)
+        
+    def test_context_manager(self):
+        inst = open(DATA_DIR + "/dimin.train").readline()
+        
+        with self.pool.client() as client:
+            self.assertTrue(client.classify(inst))
+            
+        self.assertEqual(self.pool.checkout(), client)
+        self.pool.checkin(client)
+        
+    def test_reconnect(self):
+        client = self.pool.checkout()
+        # simulate broken connection
+        client.socket.close()
+        self.pool.checkin(client, suspect=True)
+        client = self.pool.checkout()
+        self.assertEqual(client.query()["NEIGHBORS"], "1")
+        self.pool.checkin(client)
+        
+    def test_classify(self):
+        for inst in open(DATA_DIR + "/dimin.train").readlines()[:10]:
+            self.assertTrue(self.pool.classify(inst)["CATEGORY"])
+        
+    def tearDown(self):
+        self.pool.close()
+        
+
+
+class Test_TimblFarmClient(unittest.TestCase):
+    
+    farm = None
+    
+    def setUp(self):
+        if not self.farm:
+            options = "-f {0}/dimin.train".format(DATA_DIR)
+            Test_TimblFarmClient.farm = TimblServerFarm(options, n_servers=3)
+            self.farm.start()
+            
+        self.instances = open(DATA_DIR + "/dimin.train").readlines()[:100]
+        self.client = TimblClient(self.farm.ports[0])
+        self.client.connect()
+            
+    def test_classify(self):
+        for policy in TimblFarmClient.policies:
+            farm_client = TimblFarmClient(self.farm.ports, policy=policy)
+            
+            for inst in self.instances:
+                self.assertEqual(farm_client.classify(inst), 
+                                 self.client.classify(inst))
+                
+            farm_client.close()
+            
+    def test_classify_many(self):
+        for policy in TimblFarmClient.policies:
+            farm_client = TimblFarmClient(self.farm.ports, policy=policy)
+            results = list(farm_client.classify_many(self.instances, 
+                                                     window=10))
+            self.assertEqual(len(results), len(self.instances))
+            
+            for inst, (farm_inst, result) in zip(self.instances, results):
+                self.assertEqual(inst, farm_inst)
+                self.assertEqual(result, self.client.classify(inst))
+                
+            farm_client.close()
+            
+    def test_classify_many_close(self):
+        farm_client = TimblFarmClient(self.farm.ports)
+        results = farm_client.classify_many(self.instances, window=10)
+        results.next()
+        results.close()
+        
+        for pool in farm_client.pools:
+            with pool.client() as client:
+                self.assertEqual(client.query()["NEIGHBORS"], "1")
+                
+        farm_client.close()
+        
+    def test_classify_many_close_error(self):
+        farm_client = TimblFarmClient(self.farm.ports[:2])
+        results = farm_client.classify_many(self.instances, window=10)
+        results.next()
         
+        # simulate broken connections, so reading outstanding replies fails
+        for client in results.gi_frame.f_locals["clients"]:
+            client.socket.shutdown(socket.SHUT_RDWR)
+            
+        self.assertRaises((TimblClientError, socket.error), results.close)
+        
+        # clients were checked in again, and are reconnected on checkout
+        for pool in farm_client.pools:
+            self.assertEqual(pool._idle.qsize(), 1)
+            
+            with pool.client() as client:
+                self.assertEqual(client.query()["NEIGHBORS"], "1")
+                
+        farm_client.close()
+        
+    def test_classify_many_server_down(self):
+        # find a port without server
+        sock = socket.socket()
+        sock.bind(("localhost", 0))
+        down_port = sock.getsockname()[1]
+        sock.close()
+        
+        farm_client = TimblFarmClient([self.farm.ports[0], down_port])
+        self.assertRaises(socket.error, list,
+                          farm_client.classify_many(self.instances))
+        # client of the first server was checked in again
+        self.assertEqual(farm_client.pools[0]._idle.qsize(), 1)
+        farm_client.close()
         
     def tearDown(self):
         self.client.disconnect()
         
 
 
+class Test_ClientStats(unittest.TestCase):
+    
+    def test_histogram(self):
+        stats = ClientStats(buckets=(0.001, 0.01))
+        
+        for latency in 0.0005, 0.001, 0.005, 0.5:
+            stats["classify"].add_reply(latency, 2, 10)
+            
+        stats["classify"].add_reply(0.0001, 0, 10)
+        
+        classify = stats.as_dict()["classify"]
+        self.assertEqual(classify["count"], 5)
+        self.assertEqual(classify["latency_counts"], [3, 1, 1])
+        self.assertEqual(classify["recv_calls"], 8)
+        self.assertEqual(classify["max_recv_calls"], 2)
+        self.assertEqual(classify["bytes_received"], 50)
+        
+    def test_prometheus(self):
+        stats = ClientStats(buckets=(0.001, 0.01))
+        stats["query"].add_reply(0.005, 1, 40)
+        stats.timeout("set")
+        stats.error(None)
+        text = stats.to_prometheus(labels={"server": "7000"})
+        lines = text.splitlines()
+        
+        self.assertIn("# TYPE timbl_client_latency_seconds histogram", lines)
+        self.assertIn('timbl_client_latency_seconds_bucket{command="query",'
+                      'server="7000",le="0.001"} 0', lines)
+        self.assertIn('timbl_client_latency_seconds_bucket{command="query",'
+                      'server="7000",le="0.01"} 1', lines)
+        self.assertIn('timbl_client_latency_seconds_bucket{command="query",'
+                      'server="7000",le="+Inf"} 1', lines)
+        self.assertIn('timbl_client_latency_seconds_count{command="query",'
+                      'server="7000"} 1', lines)
+        self.assertIn('timbl_client_received_bytes_total{command="query",'
+                      'server="7000"} 40', lines)
+        self.assertIn('timbl_client_timeouts_total{command="set",'
+                      'server="7000"} 1', lines)
+        
+        
+
+class Test_ReplyFramer(unittest.TestCase):
+    
+    def setUp(self):
+        self.framer = ReplyFramer()
+        
+    def feed_chunks(self, data, command, size):
+        replies = []
+        
+        for i in range(0, len(data), size):
+            self.framer.feed(data[i:i+size])
+            reply = self.framer.next_reply(command)
+            
+            while reply is not None:
+                replies.append(reply)
+                reply = self.framer.next_reply(command)
+                
+        return replies
+        
+    def test_classify(self):
+        reply = "CATEGORY {T} DISTRIBUTION { T 1.00000 } DISTANCE {0.0}\n"
+        
+        for size in range(1, len(reply) + 1):
+            self.assertEqual(self.feed_chunks(3 * reply, "classify", size),
+                             3 * [reply])
+            self.assertFalse(self.framer.buffer)
+            
+    def test_classify_neighbours(self):
+        reply = ( "CATEGORY {T} NEIGHBORS\n"
+                  "# k=1, 1 Neighbor(s) at distance: \t0.0000000000000\n"
+                  "#\t=,=,=,=,=,=,=,=,+,p,e,=,{ T 1.00000 }\n"
+                  "ENDNEIGHBORS\n" )
+        
+        for size in range(1, len(reply) + 1):
+            self.assertEqual(self.feed_chunks(2 * reply, "classify", size),
+                             2 * [reply])
+            
+    def test_query(self):
+        reply = "STATUS\nNEIGHBORS : 1\nDECAY : Z\nENDSTATUS\n"
+        
+        for size in range(1, len(reply) + 1):
+            self.assertEqual(self.feed_chunks(reply, "query", size), 
+                             [reply])
+            
+    def test_set(self):
+        self.assertEqual(self.feed_chunks("OK\nOK\n", "set", 1), 
+                         2 * ["OK\n"])
+        
+    def test_error(self):
+        reply = "ERROR { set options failed }\n"
+        self.assertEqual(self.feed_chunks(reply, "set", 4), [reply])
+        self.assertEqual(self.feed_chunks(reply, "query", 4), [reply])
+        
+    def test_welcome(self):
+        reply = "Welcome to the Timbl server.\n"
+        self.assertEqual(self.feed_chunks(reply + "OK\n", None, 5), 
+                         [reply, "OK\n"])
+        
+    def test_carry_over(self):
+        self.framer.feed("CATEGORY {T}\nCATEGORY {")
+        self.assertEqual(self.framer.next_reply("classify"), "CATEGORY {T}\n")
+        self.assertEqual(self.framer.next_reply("classify"), None)
+        self.framer.feed("E}\n")
+        self.assertEqual(self.framer.next_reply("classify"), "CATEGORY {E}\n")
+        
+        
+
 if __name__ == '__main__':
     import sys
     sys.argv.append("-v")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test support for compressed files
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from distutils.spawn import find_executable
+
+from tt.compress import *
+from tt.evaluate import evaluate_output
+from tt.folds import split_folds
+from tt.gridsearch import score_outputs
+from tt.instances import read_instances
+from tt.outparser import parse_output_columns
+from tt.sample import get_class_counts, sample_down, sample_down_exact
+
+from common import DATA_DIR
+
+
+class Test_compress(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = open(DATA_DIR + "/dimin.train").read()
+        # only test compressors available on this system
+        self.exts = [ ext for ext, prog in COMPRESSORS.items() 
+                      if find_executable(prog) ]
+        
+    def test_split_ext(self):
+        self.assertEqual(split_ext("a.inst.gz"), ("a.inst", ".gz"))
+        self.assertEqual(split_ext("a.inst.XZ"), ("a.inst", ".XZ"))
+        self.assertEqual(split_ext("a.inst"), ("a.inst", ""))
+        self.assertEqual(compressor("a.inst"), None)
+        self.assertEqual(compressor("a.inst.zst"), "zstd")
+        
+    def test_round_trip(self):
+        for ext in self.exts + [""]:
+            fn = os.path.join(self.tmp_dir, "dimin.train" + ext)
+            
+            with open_file(fn, "w") as outf:
+                outf.write(self.data)
+                
+            if ext:
+                self.assertNotEqual(open(fn).read(), self.data)
+                
+            with open_file(fn) as inf:
+                self.assertEqual(inf.read(), self.data)
+                
+            self.assertEqual(list(open_file(fn)), 
+                             self.data.splitlines(True))
+            
+    def test_close_early(self):
+        for ext in self.exts:
+            fn = os.path.join(self.tmp_dir, "dimin.train" + ext)
+            
+            with open_file(fn, "w") as outf:
+                outf.write(self.data)
+                
+            inf = open_file(fn)
+            inf.readline()
+            inf.close()
+            self.assertTrue(inf.closed)
+            
+    def test_error(self):
+        for ext in self.exts:
+            fn = os.path.join(self.tmp_dir, "no_such_file" + ext)
+            self.assertRaises(IOError, open_file(fn).close)
+        
+    def truncated(self, data_fn):
+        # return filename of a gzip file with half of the compressed data
+        fn = os.path.join(self.tmp_dir, os.path.basename(data_fn) + ".gz")
+        
+        with open_file(fn, "w") as outf:
+            outf.write(open(data_fn).read())
+            
+        data = open(fn, "rb").read()
+        open(fn, "wb").write(data[:len(data) // 2])
+        return fn
+            
+    def test_truncated(self):
+        # a corrupt compressed file must raise an error instead of
+        # silently giving a partial result
+        if ".gz" not in self.exts:
+            return
+        
+        fn = self.truncated(DATA_DIR + "/dimin.train")
+        out_fn = os.path.join(self.tmp_dir, "sample.inst")
+        self.assertRaises(IOError, get_class_counts, fn, ",")
+        self.assertRaises(IOError, get_class_counts, fn, ",", cache=True)
+        self.assertFalse(os.path.exists(fn + ".classes.cache"))
+        self.assertRaises(IOError, read_instances, fn, ",")
+        self.assertRaises(IOError, sample_down, fn, {}, ",", outf=out_fn)
+        self.assertRaises(IOError, sample_down_exact, fn, {"T": 10}, 
+                          sep=",", outf=out_fn)
+        self.assertRaises(IOError, split_folds, fn, 2, out_dir=self.tmp_dir)
+        
+        fn = self.truncated(DATA_DIR + "/sample.out")
+        self.assertRaises(IOError, evaluate_output, fn)
+        self.assertRaises(IOError, parse_output_columns, fn)
+        self.assertRaises(IOError, score_outputs, [fn])
+        
+    def test_decompress_fifo(self):
+        for ext in self.exts:
+            fn = os.path.join(self.tmp_dir, "dimin.train" + ext)
+            
+            with open_file(fn, "w") as outf:
+                outf.write(self.data)
+                
+            with decompress_fifo(fn, self.tmp_dir) as fifo_fn:
+                self.assertEqual(os.path.basename(fifo_fn), "dimin.train")
+                self.assertEqual(open(fifo_fn).read(), self.data)
+                
+            # unused, or abandoned by the reader
+            with decompress_fifo(fn) as fifo_fn:
+                pass
+            
+            with decompress_fifo(fn) as fifo_fn:
+                open(fifo_fn).read(10)
+                
+            # named pipes are removed
+            self.assertEqual(os.listdir(self.tmp_dir), ["dimin.train" + ext])
+            os.remove(fn)
+            
+    def test_decompress_fifo_error(self):
+        if ".gz" not in self.exts:
+            return
+        
+        fn = self.truncated(DATA_DIR + "/dimin.train")
+        
+        def read_fifo():
+            with decompress_fifo(fn) as fifo_fn:
+                open(fifo_fn).read()
+                
+        self.assertRaises(IOError, read_fifo)
+            
+    def test_compress_fifo(self):
+        for ext in self.exts:
+            fn = os.path.join(self.tmp_dir, "dimin.out" + ext)
+            
+            with compress_fifo(fn, self.tmp_dir) as fifo_fn:
+                with open(fifo_fn, "w") as outf:
+                    outf.write(self.data)
+                    
+            self.assertEqual(open_file(fn).read(), self.data)
+            
+            # never opened for writing gives an empty file
+            with compress_fifo(fn) as fifo_fn:
+                pass
+            
+            self.assertEqual(open_file(fn).read(), "")
+            self.assertEqual(os.listdir(self.tmp_dir), ["dimin.out" + ext])
+            os.remove(fn)
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+        
+
+if __name__ == '__main__':
+    unittest.main()
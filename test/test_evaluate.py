@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test evaluation of Timbl output
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+from tt.evaluate import *
+
+from common import DATA_DIR
+
+
+class Test_evaluate(unittest.TestCase):
+    
+    def setUp(self):
+        # true class, predicted class
+        self.pairs = [("A", "A"), ("A", "B"), ("B", "B"), ("C", "A"),
+                      ("A", "A"), ("B", "B")]
+        self.timbl_output = [ "x y {0} {1}\n".format(*pair) 
+                              for pair in self.pairs ]
+    
+    def test_evaluate_sample(self):
+        cm = evaluate_output(DATA_DIR + "/sample.out", feat_sep=",",
+                             with_distrib=True)
+        self.assertEqual(cm.total(), 3)
+        self.assertEqual(cm.accuracy(), 1.0)
+        self.assertEqual(sorted(cm.classes), ["E", "J", "T"])
+        
+    def test_evaluate_parallel(self):
+        tmp_dir = tempfile.mkdtemp()
+        out_fn = os.path.join(tmp_dir, "sample.out")
+        
+        try:
+            with open(out_fn, "w") as out_file:
+                for i in range(10):
+                    out_file.write(open(DATA_DIR + "/sample.out").read())
+                    out_file.writelines(self.timbl_output)
+            
+            cm = evaluate_output(out_fn, processes=1)
+            parallel_cm = evaluate_output(out_fn, processes=3)
+            self.assertEqual(parallel_cm.total(), 90)
+            self.assertEqual(parallel_cm.total(), cm.total())
+            self.assertEqual(parallel_cm.correct(), cm.correct())
+            
+            for class_ in cm.classes:
+                self.assertEqual(parallel_cm.true_count(class_), 
+                                 cm.true_count(class_))
+        finally:
+            shutil.rmtree(tmp_dir)
+        
+    def test_evaluate(self):
+        cm = evaluate_output(self.timbl_output)
+        self.assertEqual(cm.total(), 6)
+        self.assertEqual(cm.correct(), 4)
+        self.assertAlmostEqual(cm.accuracy(), 4 / 6.0)
+        self.assertEqual(cm.count("A", "B"), 1)
+        self.assertEqual(cm.count("C", "A"), 1)
+        self.assertEqual(cm.count("C", "C"), 0)
+        self.assertEqual(cm.count("X", "A"), 0)
+        self.assertEqual(cm.true_count("A"), 3)
+        self.assertEqual(cm.pred_count("A"), 3)
+        self.assertAlmostEqual(cm.precision("A"), 2 / 3.0)
+        self.assertAlmostEqual(cm.recall("A"), 2 / 3.0)
+        self.assertAlmostEqual(cm.precision("B"), 2 / 3.0)
+        self.assertAlmostEqual(cm.recall("B"), 1.0)
+        self.assertAlmostEqual(cm.f_score("B"), 0.8)
+        self.assertEqual(cm.f_score("C"), 0.0)
+        
+    def test_update(self):
+        cm1 = evaluate_output(self.timbl_output[:3])
+        cm2 = evaluate_output(self.timbl_output[3:])
+        cm1.update(cm2)
+        cm = evaluate_output(self.timbl_output)
+        
+        for true_class in cm.classes:
+            for pred_class in cm.classes:
+                self.assertEqual(cm1.count(true_class, pred_class),
+                                 cm.count(true_class, pred_class))
+                
+    def test_print(self):
+        cm = evaluate_output(self.timbl_output)
+        out = StringIO.StringIO()
+        print_scores(cm, out)
+        print_confusion_matrix(cm, out)
+        self.assertTrue(out.getvalue())
+        
+        
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test splitting instances into folds
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt.folds import split_folds, fold_filenames
+from tt.sample import get_class_counts
+from tt.timblfile import TimblFile
+
+from common import DATA_DIR
+
+
+class Test_folds(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.inst_fn = DATA_DIR + "/dimin.train"
+        self.inst = open(self.inst_fn).readlines()
+        
+    def test_fold_filenames(self):
+        self.assertEqual(fold_filenames("a/x.inst.gz", 2),
+                         ["a/x.fold0.inst.gz", "a/x.fold1.inst.gz"])
+        self.assertEqual(fold_filenames("a/x.inst", 1, "b"),
+                         ["b/x.fold0.inst"])
+        
+    def test_split_folds(self):
+        fold_fns = split_folds(self.inst_fn, 7, out_dir=self.tmp_dir, seed=1)
+        folds = [ open(fn).readlines() for fn in fold_fns ]
+        sizes = [ len(fold) for fold in folds ]
+        self.assertTrue(max(sizes) - min(sizes) <= 1)
+        self.assertEqual(sorted(sum(folds, [])), sorted(self.inst))
+        
+        # reproducible
+        split_folds(self.inst_fn, 7, fold_fns=fold_fns, seed=1)
+        self.assertEqual([ open(fn).readlines() for fn in fold_fns ], folds)
+        
+    def test_stratified(self):
+        fold_fns = split_folds(self.inst_fn, 5, out_dir=self.tmp_dir, 
+                               stratified=True, seed=2, sep=",")
+        fold_counts = [ get_class_counts(fn, sep=",") for fn in fold_fns ]
+        
+        for class_ in get_class_counts(self.inst_fn, sep=","):
+            counts = [ counts[class_] for counts in fold_counts ]
+            self.assertTrue(max(counts) - min(counts) <= 1)
+            
+    def test_group_key(self):
+        # instances with the same last feature stay together
+        key = lambda l: l.split(",")[-2]
+        fold_fns = split_folds(self.inst, 3, 
+                               fold_fns=[ os.path.join(self.tmp_dir, str(i))
+                                          for i in range(3) ],
+                               group_key=key)
+        folds = [ set(map(key, open(fn))) for fn in fold_fns ]
+        
+        for i in range(3):
+            for j in range(i):
+                self.assertFalse(folds[i] & folds[j])
+                
+        self.assertEqual(sum(len(open(fn).readlines()) for fn in fold_fns),
+                         len(self.inst))
+        
+    def test_cross_validate(self):
+        fold_fns = split_folds(self.inst_fn, 3, out_dir=self.tmp_dir)
+        out_fns = TimblFile().cross_validate(fold_fns)[0]
+        self.assertEqual(sum(len(open(fn).readlines()) for fn in out_fns),
+                         len(self.inst))
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+        
+
+if __name__ == '__main__':
+    unittest.main()
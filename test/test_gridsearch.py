@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test grid search
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt.gridsearch import *
+
+from test_timblfile import make_folds
+
+
+class Test_gridsearch(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fold_fns = make_folds(self.tmp_dir)
+        self.results_fn = os.path.join(self.tmp_dir, "results.tab")
+        self.grid = [("-k", [1, 3]), ("-m", ["O", "M"])]
+        
+    def test_option_grid(self):
+        self.assertEqual(option_grid(self.grid),
+                         ["-k 1 -m O", "-k 1 -m M", "-k 3 -m O", "-k 3 -m M"])
+        self.assertEqual(option_grid(dict(self.grid)), 
+                         option_grid(self.grid))
+        
+    def test_estimate_cost(self):
+        self.assertTrue(estimate_cost("-k 3 -m M") > estimate_cost("-k 1 -mM"))
+        self.assertTrue(estimate_cost("-k 1 -m M") > estimate_cost("-k 1 -mO"))
+        self.assertTrue(estimate_cost("-a 0") > estimate_cost("-a 1"))
+        
+    def test_verbosity_levels(self):
+        self.assertEqual(verbosity_levels("-k 1 +vdb +vdi"), set(["db", "di"]))
+        self.assertEqual(verbosity_levels("+vdb+di+n"), 
+                         set(["db", "di", "n"]))
+        self.assertEqual(verbosity_levels("+v db+di -vdb"), set(["di"]))
+        self.assertEqual(verbosity_levels("-k 1 -v -m O"), set())
+        
+    def test_grid_search(self):
+        results = grid_search(self.fold_fns, self.grid, self.results_fn,
+                              feat_sep=",", workers=2)
+        self.assertEqual(sorted(results), sorted(option_grid(self.grid)))
+        
+        for result in results.values():
+            self.assertEqual(result["total"], 
+                             sum(len(open(fn).readlines()) 
+                                 for fn in self.fold_fns))
+            self.assertTrue(0 <= result["accuracy"] <= 1)
+            
+        saved_results = read_results(self.results_fn)
+        self.assertEqual(sorted(saved_results), sorted(results))
+        
+        for options, result in results.items():
+            self.assertEqual(saved_results[options]["correct"],
+                             result["correct"])
+        
+    def test_train_opts(self):
+        ibase_dir = os.path.join(self.tmp_dir, "ibases")
+        os.mkdir(ibase_dir)
+        grid = [("-a", [0, 1]), ("-k", [1, 3])]
+        results = grid_search(self.fold_fns, grid, self.results_fn,
+                              ibase_dir=ibase_dir, train_opts=("-a",),
+                              feat_sep=",")
+        self.assertEqual(sorted(results), sorted(option_grid(grid)))
+        # one instance base per fold and value of training option -a
+        ibase_fns = [ fn for fn in os.listdir(ibase_dir)
+                      if fn.endswith(".ibase") ]
+        self.assertEqual(len(ibase_fns), 2 * len(self.fold_fns))
+        
+    def test_resume(self):
+        grid_search(self.fold_fns, [("-k", [1, 3]), ("-m", ["O"])],
+                    self.results_fn, feat_sep=",")
+        # simulate interrupted run
+        open(self.results_fn, "a").write("-k 5 -m O\t0.5")
+        results = grid_search(self.fold_fns, self.grid, self.results_fn,
+                              feat_sep=",")
+        self.assertEqual(len(results), 4)
+        lines = open(self.results_fn).readlines()
+        # header, 2 results, incomplete line, 2 results
+        self.assertEqual(len(lines), 6)
+        # nothing left to do
+        grid_search(self.fold_fns, self.grid, self.results_fn, feat_sep=",")
+        self.assertEqual(open(self.results_fn).readlines(), lines)
+    
+    def test_resume_empty(self):
+        # simulate run interrupted before writing the header
+        open(self.results_fn, "w").close()
+        results = grid_search(self.fold_fns, self.grid, self.results_fn,
+                              feat_sep=",")
+        self.assertEqual(len(results), 4)
+        self.assertEqual(open(self.results_fn).readline(), 
+                         "\t".join(FIELDS) + "\n")
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv.append("-v")
+    unittest.main()
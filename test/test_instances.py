@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test InstanceStore class
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt.instances import InstanceStore, read_instances
+from tt.exception import TimblToolsError
+from tt.sample import get_class_counts
+
+from common import DATA_DIR
+
+
+class Test_InstanceStore(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.inst_fn = DATA_DIR + "/dimin.train"
+        self.lines = open(self.inst_fn).readlines()
+        self.store = read_instances(self.inst_fn, sep=",")
+        
+    def test_read(self):
+        self.assertEqual(len(self.store), len(self.lines))
+        self.assertEqual(self.store.n_feats, 12)
+        
+        for i, l in enumerate(self.lines):
+            self.assertEqual(self.store.line(i), l)
+            
+        feats, class_ = self.store[0]
+        self.assertEqual(",".join(feats + [class_]) + "\n", self.lines[0])
+        self.assertEqual(self.store.class_column.typecode, "B")
+        
+    def test_class_counts(self):
+        self.assertEqual(self.store.class_counts(),
+                         get_class_counts(self.inst_fn, sep=","))
+        
+    def test_save_load(self):
+        fn = os.path.join(self.tmp_dir, "dimin.store")
+        self.store.save(fn)
+        store = InstanceStore.load(fn)
+        self.assertEqual(store.values, self.store.values)
+        self.assertEqual(store.columns, self.store.columns)
+        self.assertEqual(store.line(10), self.lines[10])
+        
+        open(fn, "w").write("garbage")
+        self.assertRaises(TimblToolsError, InstanceStore.load, fn)
+        
+    def test_write(self):
+        fn = os.path.join(self.tmp_dir, "sample.inst.gz")
+        self.store.write(fn, indices=range(0, len(self.store), 10))
+        store = read_instances(fn, sep=",")
+        self.assertEqual(len(store), (len(self.lines) + 9) // 10)
+        self.assertEqual(store.line(1), self.lines[10])
+        
+    def test_upgrade(self):
+        store = InstanceStore(1)
+        
+        for i in range(70000):
+            store.add([str(i), "T"])
+            
+        self.assertEqual(store.columns[0].typecode, "I")
+        self.assertEqual(store.class_column.typecode, "B")
+        self.assertEqual(store.line(69999), "69999 T\n")
+        self.assertEqual(store[256], (["256"], "T"))
+        self.assertRaises(TimblToolsError, store.add, ["a", "b", "T"])
+        
+    def test_whitespace(self):
+        store = read_instances(["a b  T\n", "\n", "a\tc P \n"])
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.classes, ["T", "P"])
+        self.assertEqual(store.line(1), "a c P\n")
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+        
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test OutputIndex class
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt.outindex import OutputIndex
+from tt.outparser import parse_timbl_output
+
+from common import DATA_DIR
+
+
+class Test_OutputIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_fn = os.path.join(self.tmp_dir, "sample.out")
+        shutil.copy(DATA_DIR + "/sample.out", self.out_fn)
+        
+    def test_get(self):
+        with OutputIndex(self.out_fn) as index:
+            parsed = list(parse_timbl_output(open(self.out_fn)))
+            self.assertEqual(len(index), len(parsed))
+            
+            for i, pair in enumerate(parsed):
+                self.assertEqual(index.get(i), pair)
+                
+            self.assertEqual(index[-1], parsed[-1])
+            self.assertRaises(IndexError, index.get, len(parsed))
+            
+    def test_sidecar(self):
+        OutputIndex(self.out_fn).close()
+        self.assertTrue(os.path.exists(self.out_fn + ".idx"))
+        
+        with OutputIndex(self.out_fn) as index:
+            offsets = index.offsets
+            self.assertEqual(index._build(), offsets)
+        
+        # outdated index is rebuilt
+        with open(self.out_fn, "a") as out_file:
+            out_file.write("a b T T\n")
+            
+        with OutputIndex(self.out_fn) as index:
+            self.assertEqual(len(index), len(offsets) + 1)
+            self.assertEqual(index.get(-1), ("a b T T\n", []))
+            
+    def test_no_save(self):
+        OutputIndex(self.out_fn, save=False).close()
+        self.assertFalse(os.path.exists(self.out_fn + ".idx"))
+            
+    def test_empty(self):
+        open(self.out_fn, "w").close()
+        
+        with OutputIndex(self.out_fn) as index:
+            self.assertEqual(len(index), 0)
+            self.assertRaises(IndexError, index.get, 0)
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+        
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,8 @@ test Timbl output parsing
 
 import unittest
 
+from array import array
+
 from tt.outparser import *
 
 from common import DATA_DIR
@@ -162,9 +164,78 @@ class Test_outparser(unittest.TestCase):
         
     def tearDown(self):
         pass
+
+    def test_parse_output_columns(self):
+        columns = parse_output_columns(DATA_DIR + "/sample.out", feat_sep=",",
+                                       with_distrib=True)
+        parser = parse_timbl_output(open(DATA_DIR + "/sample.out"))
+        self.assertEqual(len(columns), 3)
+        self.assertFalse(columns.distances)
+        
+        for i, (inst_str, k_nn_list) in enumerate(parser):
+            feats_str, true_class, pred_class = parse_inst(
+                inst_str, feat_sep=",", with_distrib=True)[:3]
+            self.assertEqual(columns.feats_str(i), feats_str)
+            self.assertEqual(columns.true_class(i), true_class)
+            self.assertEqual(columns.pred_class(i), pred_class)
+            
+    def test_parse_output_columns_with_distance(self):
+        timbl_output = [ "a b T P { T 1.00000, P 2.00000 }        0.5\n",
+                         "# k=1\t{ T 1.00000 }\t0.5\n",
+                         "c d P P { P 1.00000 }        1.25\n" ]
+        columns = parse_output_columns(timbl_output, with_distrib=True,
+                                       with_distance=True)
+        self.assertEqual(columns.classes, ["T", "P"])
+        self.assertEqual(list(columns.true_ids), [0, 1])
+        self.assertEqual(list(columns.pred_ids), [1, 1])
+        self.assertEqual(list(columns.distances), [0.5, 1.25])
+        self.assertEqual(columns.feats, "a bc d")
+        self.assertEqual(list(columns.feat_offsets), [0, 3, 6])
+        self.assertEqual(columns.feats_str(1), "c d")
+
+    def test_parse_neighbour_vk_vdi_batch(self):
+        k_nn_list = [ "# k=1\t{ T 1.00000 }\t0.0000000000000\n",
+                      "# k=2\t{ T 13.0000, J 1.00000 }\t0.042844587034556\n",
+                      "# k=4\t{ T 1.00000, J 79.0000 }\t0.22791476779488\n" ]
+        distrib_strs, distances = parse_neighbour_vk_vdi_batch(k_nn_list)
+        
+        for nn_str, distrib_str, distance in zip(k_nn_list, distrib_strs,
+                                                 distances):
+            self.assertEqual((distrib_str, distance), 
+                             parse_neighbour_vk_vdi(nn_str))
+            
+        self.assertEqual(len(distances), 3)
+        self.assertEqual(parse_neighbour_vk_vdi_batch([]), ([], array("d")))
         
+    def test_parse_vn_vdb_batch(self):
+        timbl_output = open(DATA_DIR + "/sample.out")
+        class_ids = {}
+        
+        for inst_str, k_nn_list in parse_timbl_output(timbl_output):
+            distances = parse_distance_vn_vdb_batch(k_nn_list)
+            feats, ids = parse_neighbour_vn_vdb_batch(k_nn_list, class_ids)
+            classes = sorted(class_ids, key=class_ids.get)
+            
+            self.assertEqual(
+                list(distances),
+                [ parse_distance_vn_vdb(nn_str) for nn_str in k_nn_list 
+                  if nn_str.startswith("# k=") ])
+            self.assertEqual(
+                zip(feats, [ classes[id] for id in ids ]),
+                [ parse_neighbour_vn_vdb(nn_str) for nn_str in k_nn_list 
+                  if nn_str.startswith("#\t") ])
+            self.assertEqual(len(distances) + len(ids), len(k_nn_list))
+            
+    def test_parse_vn_vdb_batch_order(self):
+        # ids are assigned in order of first occurrence
+        k_nn_list = [ "#\ta,b,{ " + class_ + " 1.00000 }\n"
+                      for class_ in "ZAMAZQ" ]
+        class_ids = {"M": 0}
+        feats, ids = parse_neighbour_vn_vdb_batch(k_nn_list, class_ids)
+        self.assertEqual(class_ids, {"M": 0, "Z": 1, "A": 2, "Q": 3})
+        self.assertEqual(list(ids), [1, 2, 0, 2, 1, 3])
         
         
 
 if __name__ == '__main__':
-    unittest.main()    
\ No newline at end of file
+    unittest.main()
@@ -8,10 +8,15 @@ test sampling instances
 # -write proper tests which do not rely on visual inspection
 
 
+import os
+import random
+import shutil
+import tempfile
 import unittest
 import StringIO
 
 from tt.sample import *
+from tt.compress import open_file
 
 from common import DATA_DIR
 
@@ -26,6 +31,24 @@ class Test_sample(unittest.TestCase):
         print_class_dist(class_count)
         
         
+    def test_class_count_parallel(self):
+        class_count = get_class_counts(self.inf, sep=",")
+        self.assertEqual(sum(class_count.values()), 
+                         len(open(DATA_DIR + "/dimin.train").readlines()))
+        
+        for processes in 2, 3, None:
+            self.assertEqual(get_class_counts(DATA_DIR + "/dimin.train", 
+                                              sep=",", processes=processes),
+                             class_count)
+            
+    def test_class_count_field(self):
+        lines = ["a b  T\n", "a b\tT \n", "\n", "c d P\n"]
+        self.assertEqual(get_class_counts(lines), {"T": 2, "P": 1})
+        self.assertEqual(get_class_counts(lines, class_field=0), 
+                         {"a": 2, "c": 1})
+        self.assertEqual(get_class_counts(["a::b::T"], sep="::"), {"T": 1})
+        self.assertEqual(get_class_counts(["T\n"], sep="::"), {"T": 1})
+        
     def test_downsampling(self):
         outf = StringIO.StringIO()
         sample_down(self.inf, {"T": 0.5, "K": 0.5}, sep=",", outf=outf)
@@ -33,7 +56,86 @@ class Test_sample(unittest.TestCase):
         class_count = get_class_counts(outf, sep=",")
         print_class_dist(class_count)
         
+    def test_downsampling_seed(self):
+        samples = []
+        
+        for i in range(2):
+            outf = StringIO.StringIO()
+            sample_down(DATA_DIR + "/dimin.train", {"T": 0.5}, sep=",", 
+                        outf=outf, seed=13)
+            samples.append(outf.getvalue())
+            
+        self.assertEqual(samples[0], samples[1])
+        
+    def test_downsampling_module_seed(self):
+        # without seed, the module's generator is used
+        samples = []
+        
+        for i in range(2):
+            random.seed(1)
+            outf = StringIO.StringIO()
+            sample_down(DATA_DIR + "/dimin.train", {"T": 0.5}, sep=",", 
+                        outf=outf)
+            samples.append(outf.getvalue())
+            
+        self.assertEqual(samples[0], samples[1])
+        
+    def test_downsampling_multi(self):
+        tmp_dir = tempfile.mkdtemp()
+        fracts = [0.1, 0.5, 1.0]
+        out_fns = [ os.path.join(tmp_dir, "sample{0}.inst.gz".format(fract))
+                    for fract in fracts ]
+        
+        try:
+            sample_down_multi(DATA_DIR + "/dimin.train", 
+                              [ (out_fn, {"T": fract}) 
+                                for out_fn, fract in zip(out_fns, fracts) ],
+                              sep=",", seed=3)
+            samples = [ list(open_file(fn)) for fn in out_fns ]
+        finally:
+            shutil.rmtree(tmp_dir)
+            
+        # same sample as a single run with the same seed
+        outf = StringIO.StringIO()
+        sample_down(DATA_DIR + "/dimin.train", {"T": 0.5}, sep=",", 
+                    outf=outf, seed=3)
+        self.assertEqual("".join(samples[1]), outf.getvalue())
+        # smaller samples are subsets of larger ones
+        self.assertTrue(set(samples[0]) <= set(samples[1]))
+        self.assertEqual(samples[2], 
+                         open(DATA_DIR + "/dimin.train").readlines())
+        
+    def test_downsampling_exact_sizes(self):
+        counts = get_class_counts(self.inf, sep=",")
+        self.inf.seek(0)
+        outf = StringIO.StringIO()
+        sample_down_exact(self.inf, class_sizes={"T": 100, "E": 10**6}, 
+                          sep=",", outf=outf, seed=1)
+        lines = outf.getvalue().splitlines(True)
+        sample_counts = get_class_counts(lines, sep=",")
+        self.assertEqual(sample_counts["T"], 100)
+        self.assertEqual(sample_counts, dict(counts, T=100))
+        # sampled lines keep their original order
+        t_lines = [ l for l in lines if l.endswith(",T\n") ]
+        inst_lines = open(DATA_DIR + "/dimin.train").readlines()
+        self.assertEqual(t_lines, sorted(t_lines, key=inst_lines.index))
+        
+    def test_downsampling_exact_fracts(self):
+        counts = get_class_counts(self.inf, sep=",")
+        samples = []
         
+        for i in range(2):
+            outf = StringIO.StringIO()
+            sample_down_exact(DATA_DIR + "/dimin.train", 
+                              class_fracts={"T": 0.5, "K": 0.1}, sep=",", 
+                              outf=outf, seed=7)
+            samples.append(outf.getvalue())
+            
+        self.assertEqual(samples[0], samples[1])
+        sample_counts = get_class_counts(samples[0].splitlines(), sep=",")
+        self.assertEqual(sample_counts["T"], int(round(counts["T"] * 0.5)))
+        self.assertEqual(sample_counts["K"], int(round(counts["K"] * 0.1)))
+        self.assertEqual(sample_counts["E"], counts["E"])
         
         
 
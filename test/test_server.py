@@ -9,7 +9,7 @@ import logging
 import os
 import tempfile
 
-from tt.server import TimblServer, TimblServerError
+from tt.server import TimblServer, TimblServerFarm, TimblServerError
 from tt.log import file_logger
 
 from common import DATA_DIR
@@ -108,6 +108,46 @@ class Test_TimblServer(unittest.TestCase):
 
 
 
+class Test_TimblServerFarm(unittest.TestCase):
+
+    def setUp(self):
+        self.timbl_opts = "-f {0}/dimin.train".format(DATA_DIR)
+
+    def test_start_and_stop(self):
+        farm = TimblServerFarm(timbl_opts=self.timbl_opts, n_servers=3)
+        farm.start()
+        self.assertEqual(len(set(farm.ports)), 3)
+
+        for pid in farm.pids:
+            self.assertTrue(pid in TimblServer.kill_pids)
+            self.assertTrue(os.getpgid(pid))
+
+        pids = farm.pids
+        farm.stop()
+
+        for pid in pids:
+            self.assertFalse(pid in TimblServer.kill_pids)
+            self.assertRaises(OSError, os.getpgid, pid)
+
+    def test_restart(self):
+        farm = TimblServerFarm(timbl_opts=self.timbl_opts, n_servers=2)
+        farm.start()
+        farm.restart()
+        self.assertEqual(len(set(farm.ports)), 2)
+
+        for pid in farm.pids:
+            self.assertTrue(pid in TimblServer.kill_pids)
+            self.assertTrue(os.getpgid(pid))
+
+        farm.stop()
+
+    def test_start_error(self):
+        farm = TimblServerFarm(timbl_opts="-f no_such_file", n_servers=2)
+        self.assertRaises(TimblServerError, farm.start)
+        self.assertFalse(any(farm.pids))
+
+
+
 if __name__ == '__main__':
     import sys
     sys.argv.append("-v")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test TimblFile class
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt.timblfile import TimblFile
+from tt.exception import TimblFileError
+from tt.compress import open_file
+
+from common import DATA_DIR
+
+
+def make_folds(dir, n=4):
+    """
+    split dimin.train into n fold files in dir
+    """
+    inst = open(DATA_DIR + "/dimin.train").readlines()
+    fold_fns = []
+    
+    for i in range(n):
+        fn = os.path.join(dir, "fold{0}.inst".format(i))
+        open(fn, "w").writelines(inst[i::n])
+        fold_fns.append(fn)
+        
+    return fold_fns
+
+
+class Test_TimblFile(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fold_fns = make_folds(self.tmp_dir)
+        self.timbl_file = TimblFile()
+        
+    def test_cross_validate(self):
+        out_fns, log_fns = self.timbl_file.cross_validate(self.fold_fns, 
+                                                          log=True)
+        self.assertEqual(len(out_fns), len(self.fold_fns))
+        
+        for inst_fn, out_fn, log_fn in zip(self.fold_fns, out_fns, log_fns):
+            self.assertEqual(out_fn, os.path.splitext(inst_fn)[0] + ".out")
+            self.assertEqual(len(open(out_fn).readlines()), 
+                             len(open(inst_fn).readlines()))
+            self.assertTrue(os.path.exists(log_fn))
+            
+    def test_cross_validate_parallel(self):
+        seq_out_fns = self.timbl_file.cross_validate(
+            self.fold_fns, out_dir=self.tmp_dir)[0]
+        seq_outs = [ open(fn).read() for fn in seq_out_fns ]
+        par_out_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        par_out_fns = self.timbl_file.cross_validate(
+            self.fold_fns, out_dir=par_out_dir, workers=4)[0]
+        
+        for seq_out_fn, par_out_fn, seq_out in zip(seq_out_fns, par_out_fns,
+                                                    seq_outs):
+            self.assertEqual(os.path.basename(seq_out_fn),
+                             os.path.basename(par_out_fn))
+            self.assertEqual(open(par_out_fn).read(), seq_out)
+            
+    def test_cross_validate_failure(self):
+        test_inst_fns = list(self.fold_fns)
+        test_inst_fns[2] = os.path.join(self.tmp_dir, "no_such_file")
+        
+        for workers in 1, 2:
+            try:
+                self.timbl_file.cross_validate(self.fold_fns, 
+                                               test_inst_fns=test_inst_fns,
+                                               out_dir=self.tmp_dir,
+                                               workers=workers)
+            except TimblFileError as err:
+                self.assertEqual(err.failures.keys(), [2])
+            else:
+                self.fail("TimblFileError not raised")
+            
+    def test_cross_validate_ibase_cache(self):
+        ibase_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        self.timbl_file.cross_validate(self.fold_fns, ibase_dir=ibase_dir)
+        ibase_fns = [ fn for fn in os.listdir(ibase_dir)
+                      if fn.endswith(".ibase") ]
+        self.assertEqual(len(ibase_fns), len(self.fold_fns))
+        mtimes = [ os.path.getmtime(os.path.join(ibase_dir, fn))
+                   for fn in ibase_fns ]
+        
+        # reuse instance bases, only changing test options 
+        self.timbl_file.cross_validate(self.fold_fns, ibase_dir=ibase_dir,
+                                       options="+vdb", workers=2)
+        self.assertEqual(sorted(ibase_fns),
+                         sorted(fn for fn in os.listdir(ibase_dir)
+                                if fn.endswith(".ibase")))
+        self.assertEqual(mtimes, 
+                         [ os.path.getmtime(os.path.join(ibase_dir, fn))
+                           for fn in ibase_fns ])
+        
+        # different training options require new instance bases
+        self.timbl_file.cross_validate(self.fold_fns, ibase_dir=ibase_dir,
+                                       train_options="-a1")
+        ibase_fns = [ fn for fn in os.listdir(ibase_dir)
+                      if fn.endswith(".ibase") ]
+        self.assertEqual(len(ibase_fns), 2 * len(self.fold_fns))
+            
+    def test_test_multi(self):
+        inst_base_fn = os.path.join(self.tmp_dir, "train.ibase")
+        self.timbl_file.train_multi(self.fold_fns[:2], inst_base_fn)
+        out_fns = self.timbl_file.test_multi(self.fold_fns[2:], inst_base_fn)
+        
+        for inst_fn, out_fn in zip(self.fold_fns[2:], out_fns):
+            self.assertEqual(len(open(out_fn).readlines()), 
+                             len(open(inst_fn).readlines()))
+            
+    def test_train_test_multi(self):
+        out_fns = self.timbl_file.train_test_multi(self.fold_fns[:2],
+                                                   self.fold_fns[2:],
+                                                   out_dir=self.tmp_dir)[0]
+        
+        for inst_fn, out_fn in zip(self.fold_fns[2:], out_fns):
+            out_lines = open(out_fn).readlines()
+            inst_lines = open(inst_fn).readlines()
+            self.assertEqual(len(out_lines), len(inst_lines))
+            self.assertTrue(out_lines[-1].startswith(inst_lines[-1].strip()))
+            
+    def test_compressed(self):
+        gz_fold_fns = []
+        
+        for fn in self.fold_fns:
+            with open_file(fn + ".gz", "w") as outf:
+                outf.write(open(fn).read())
+            gz_fold_fns.append(fn + ".gz")
+            
+        out_fn = os.path.join(self.tmp_dir, "fold3.out.gz")
+        self.timbl_file.train_test(gz_fold_fns[0], gz_fold_fns[3], 
+                                   out_fn=out_fn)
+        out_lines = list(open_file(out_fn))
+        self.assertEqual(len(out_lines), 
+                         len(open(self.fold_fns[3]).readlines()))
+        
+        out_fns = self.timbl_file.cross_validate(gz_fold_fns)[0]
+        
+        for fn, out_fn in zip(self.fold_fns, out_fns):
+            self.assertEqual(out_fn, os.path.splitext(fn)[0] + ".out.gz")
+            self.assertEqual(len(list(open_file(out_fn))),
+                             len(open(fn).readlines()))
+            
+        # plain and compressed folds plus outputs, but no decompressed copies
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 12)
+            
+    def test_compressed_no_fifos(self):
+        # decompressed copies in a given temp dir instead of named pipes
+        tmp_dir = os.path.join(self.tmp_dir, "tmp")
+        os.mkdir(tmp_dir)
+        timbl_file = TimblFile(tmp_dir=tmp_dir, fifos=False)
+        
+        with open_file(self.fold_fns[3] + ".gz", "w") as outf:
+            outf.write(open(self.fold_fns[3]).read())
+            
+        out_fn = os.path.join(self.tmp_dir, "fold3.out.gz")
+        timbl_file.train_test(self.fold_fns[0], self.fold_fns[3] + ".gz",
+                              out_fn=out_fn)
+        self.assertEqual(len(list(open_file(out_fn))), 
+                         len(open(self.fold_fns[3]).readlines()))
+        self.assertEqual(os.listdir(tmp_dir), [])
+            
+    def test_cat_inst_files(self):
+        # path with spaces and file without final newline
+        fn = os.path.join(self.tmp_dir, "no newline.inst")
+        open(fn, "w").write("a,b,c,T")
+        all_inst_fn = self.timbl_file._cat_inst_files(self.fold_fns + [fn])
+        expected = "".join(open(fn).read() for fn in self.fold_fns)
+        self.assertEqual(open(all_inst_fn).read(), expected + "a,b,c,T\n")
+        os.remove(all_inst_fn)
+            
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv.append("-v")
+    unittest.main()